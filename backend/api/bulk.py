@@ -0,0 +1,94 @@
+from django.db import connections, router, transaction
+
+from recipes.counters import decrement_many, increment_many
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+ABSENT = 'absent'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+
+INSERT_SQL = """
+INSERT INTO {table} ({columns}) VALUES {rows}
+ON CONFLICT DO NOTHING
+RETURNING {field}
+"""
+
+
+def insert_returning(connection, model, field, objs):
+    """Вставляет строки, пропуская дубликаты, одним INSERT в PostgreSQL.
+
+    Возвращает множество значений field у действительно вставленных строк,
+    поэтому параллельная вставка той же пары не считается повторно.
+    """
+    if not objs:
+        return set()
+    fields = [
+        model_field for model_field in model._meta.concrete_fields
+        if not model_field.primary_key
+    ]
+    quote = connection.ops.quote_name
+    row = '({})'.format(', '.join(['%s'] * len(fields)))
+    sql = INSERT_SQL.format(
+        table=quote(model._meta.db_table),
+        columns=', '.join(quote(model_field.column) for model_field in fields),
+        rows=', '.join([row] * len(objs)),
+        field=quote(model._meta.get_field(field).column),
+    )
+    params = [
+        model_field.get_db_prep_save(
+            model_field.pre_save(obj, True), connection)
+        for obj in objs for model_field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {value for value, in cursor.fetchall()}
+
+
+def bulk_add(user, ids, model, field, target_model, counter, excluded=()):
+    """Добавляет связи пользователя с объектами пачкой.
+
+    Все id проверяются одним запросом IN, новые строки вставляются одним
+    INSERT, а счетчики объектов увеличиваются одним UPDATE. В PostgreSQL
+    добавленными считаются только строки, которые вернул INSERT ... ON
+    CONFLICT DO NOTHING RETURNING. Возвращает статус для каждого id в
+    порядке запроса.
+    """
+    ids = list(dict.fromkeys(ids))
+    found = set(target_model.objects.filter(pk__in=ids)
+                .values_list('pk', flat=True))
+    candidates = found - set(excluded)
+    connection = connections[router.db_for_write(model)]
+    with transaction.atomic(using=connection.alias):
+        if connection.vendor == 'postgresql':
+            created = insert_returning(
+                connection, model, field,
+                [model(user=user, **{field: pk}) for pk in candidates])
+        else:
+            created = candidates - set(model.objects.filter(
+                user=user, **{f'{field}__in': candidates}
+            ).values_list(field, flat=True))
+            model.objects.bulk_create(
+                [model(user=user, **{field: pk}) for pk in created],
+                ignore_conflicts=True,
+            )
+        increment_many(target_model, created, counter)
+    statuses = {pk: EXISTS for pk in candidates - created}
+    statuses.update({pk: ADDED for pk in created})
+    statuses.update({pk: FORBIDDEN for pk in excluded if pk in found})
+    return [{'id': pk, 'status': statuses.get(pk, NOT_FOUND)} for pk in ids]
+
+
+def bulk_remove(user, ids, model, field, target_model, counter):
+    """Удаляет связи пользователя с объектами одним DELETE."""
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic():
+        rows = model.objects.filter(user=user, **{f'{field}__in': ids})
+        removed = set(rows.values_list(field, flat=True))
+        rows.delete()
+        decrement_many(target_model, removed, counter)
+    return [
+        {'id': pk, 'status': REMOVED if pk in removed else ABSENT}
+        for pk in ids
+    ]
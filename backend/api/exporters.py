@@ -0,0 +1,51 @@
+import csv
+import json
+
+from rest_framework.negotiation import DefaultContentNegotiation
+
+SHOPPING_CART_FILENAME = 'shopping_cart'
+
+
+class Echo:
+    """Псевдо-буфер для построчной записи csv."""
+
+    def write(self, value):
+        return value
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """Параметр format задает формат выгрузки, а не рендерер DRF."""
+
+    def filter_renderers(self, renderers, format):
+        return renderers
+
+
+def shopping_cart_txt(items):
+    yield 'Список покупок:\n\n'
+    for name, unit, amount in items:
+        yield f'{name}, ({unit}) — {amount}\n'
+
+
+def shopping_cart_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for row in items:
+        yield writer.writerow(row)
+
+
+def shopping_cart_json(items):
+    separator = '['
+    for name, unit, amount in items:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': amount},
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', shopping_cart_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_cart_csv),
+    'json': ('application/json', shopping_cart_json),
+}
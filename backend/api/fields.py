@@ -1,17 +1,174 @@
 import base64
+import binascii
+import os
+import tempfile
+from contextlib import suppress
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+from api.images import THUMBNAIL, variant_url
+
+BASE64_MARKER = ';base64,'
+BASE64_HEADER_LENGTH = 64
+BASE64_CHUNK_SIZE = 64 * 1024
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+
+def sniff_image(head):
+    """Расширение файла по сигнатуре изображения или None."""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, ext in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def decode_base64_chunks(data, start):
+    """Декодирует base64 частями по BASE64_CHUNK_SIZE символов.
+
+    Переносы строк и пробелы (base64 в стиле MIME) выбрасываются, а
+    хвост части, не кратный 4 символам, переносится в следующую часть.
+    """
+    rest = ''
+    for position in range(start, len(data), BASE64_CHUNK_SIZE):
+        chunk = rest + ''.join(
+            data[position:position + BASE64_CHUNK_SIZE].split())
+        aligned = len(chunk) - len(chunk) % 4
+        rest = chunk[aligned:]
+        if aligned:
+            yield base64.b64decode(chunk[:aligned])
+    if rest:
+        yield base64.b64decode(rest)
+
+
+class DecodedImageFile(File):
+    """Изображение во временном файле, который хранилище может переместить."""
+
+    def __init__(self, name, content_type):
+        descriptor, self.path = tempfile.mkstemp(
+            suffix='.upload', dir=settings.FILE_UPLOAD_TEMP_DIR)
+        super().__init__(os.fdopen(descriptor, 'w+b'), name)
+        self.content_type = content_type
+        self.charset = None
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        self.file.close()
+        with suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    def __del__(self):
+        self.close()
+
 
 class Base64ImageField(serializers.ImageField):
-    """Сериализация изображений."""
+    """Сериализация изображений.
+
+    Base64 декодируется частями во временный файл, а размер, формат и
+    количество пикселей проверяются до декодирования всего изображения.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} Мб.',
+        'too_many_pixels': (
+            'Изображение не должно содержать больше {max_pixels} пикселей.'),
+        'invalid_base64': 'Некорректные данные изображения в base64.',
+    }
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+            data = self.decode(data)
+        return super().to_internal_value(data)
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+    def check_pixels(self, file):
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Exception:
+            return False
+        if width * height > settings.UPLOAD_MAX_PIXELS:
+            self.fail('too_many_pixels',
+                      max_pixels=settings.UPLOAD_MAX_PIXELS)
+        return True
 
-        return super().to_internal_value(data)
+    def decode(self, data):
+        start = data.find(BASE64_MARKER, 0, BASE64_HEADER_LENGTH)
+        if start == -1:
+            self.fail('invalid_base64')
+        start += len(BASE64_MARKER)
+        size = (len(data) - start - data.count('\n', start)
+                - data.count('\r', start)) * 3 // 4
+        if size > settings.UPLOAD_MAX_SIZE:
+            self.fail('too_large',
+                      max_size=settings.UPLOAD_MAX_SIZE // (1024 * 1024))
+
+        chunks = decode_base64_chunks(data, start)
+        try:
+            head = next(chunks, b'')
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        ext = sniff_image(head)
+        if ext is None:
+            self.fail('invalid_image')
+        pixels_checked = self.check_pixels(BytesIO(head))
+
+        name = f'temp.{ext}'
+        content_type = f'image/{ext}'
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = DecodedImageFile(name, content_type)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None)
+        file.write(head)
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        file.size = file.tell()
+        file.seek(0)
+        if not pixels_checked:
+            self.check_pixels(file)
+            file.seek(0)
+        return file
+
+
+class ImageVariantField(serializers.ImageField):
+    """Ссылка на изображение: в списках отдается уменьшенная копия."""
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        if self.variant:
+            return self.variant
+        view = self.context.get('view')
+        if getattr(view, 'action', None) == 'list':
+            return THUMBNAIL
+        return None
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = variant_url(value, self.get_variant())
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
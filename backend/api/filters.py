@@ -1,37 +1,71 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeTag,
+                            ShoppingCart, Tag)
+from recipes.search import search_recipes
 
 User = get_user_model()
 
+RECIPE_ORDERINGS = {
+    'popular': (F('popularity_score').desc(nulls_last=True), '-id'),
+    'recent': ('-id',),
+    'quick': ('cooking_time', '-id'),
+}
+
 
 class RecipeFilter(FilterSet):
 
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.ModelMultipleChoiceFilter(
+        queryset=Tag.objects.all(),
+        to_field_name='slug',
+        method='filter_tags',
+    )
 
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        # IN (подзапрос) не размножает рецепты с несколькими тегами и
+        # читает recipe_tag_idx по тегу.
+        return queryset.filter(pk__in=RecipeTag.objects.filter(
+            tag__in=value).values('recipe'))
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated:
             if value:
-                return queryset.filter(favorites__user=user)
+                return queryset.filter(Exists(Favourite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if user.is_authenticated:
             if value:
-                return queryset.filter(shopping_carts__user=user)
+                return queryset.filter(Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk'))))
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections
+from PIL import Image
+
+from recipes.cache import bump_recipes_version
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+THUMBNAIL = 'thumbnail'
+WEBP = 'webp'
+# Поле модели с именем изображения, для которого готовы варианты.
+VARIANTS_FIELD = '{}_variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_progress = set()
+
+
+def variant_name(name, variant):
+    """Путь варианта изображения рядом с оригиналом.
+
+    Имя включает расширение оригинала: у temp.png и temp.jpg варианты
+    разные.
+    """
+    directory, filename = os.path.split(name)
+    suffix = '_thumb' if variant == THUMBNAIL else ''
+    return os.path.join(directory, VARIANTS_DIR, f'{filename}{suffix}.webp')
+
+
+def variants_ready(field_file):
+    """Варианты готовы, если генератор отметил именно это изображение.
+
+    Отметка хранится в строке модели, поэтому при чтении хранилище не
+    опрашивается, а замена изображения сама ее сбрасывает.
+    """
+    return getattr(
+        field_file.instance, VARIANTS_FIELD.format(field_file.field.name),
+        None,
+    ) == field_file.name
+
+
+def mark_variants_ready(model, field_name, name):
+    """Отмечает варианты изображения name готовыми.
+
+    Если изображение успели заменить, строка не обновляется. Возвращает
+    число отмеченных строк.
+    """
+    return model.objects.filter(**{field_name: name}).update(
+        **{VARIANTS_FIELD.format(field_name): name})
+
+
+def variant_url(field_file, variant):
+    """URL варианта, если он уже готов, иначе URL оригинала."""
+    if variant and variants_ready(field_file):
+        return field_file.storage.url(variant_name(field_file.name, variant))
+    return field_file.url
+
+
+def delete_image(storage, name):
+    """Удаляет изображение вместе с его вариантами."""
+    for path in (name, *(variant_name(name, variant)
+                         for variant in (WEBP, THUMBNAIL))):
+        try:
+            storage.delete(path)
+        except OSError:
+            logger.exception('Не удалось удалить файл %s', path)
+
+
+def _save_webp(storage, image, name):
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=settings.IMAGE_WEBP_QUALITY)
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_variants(storage, name):
+    """Создает уменьшенную копию и WebP-версию изображения."""
+    with storage.open(name) as file, Image.open(file) as image:
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        _save_webp(storage, image, variant_name(name, WEBP))
+        image.thumbnail(settings.IMAGE_THUMBNAIL_SIZE)
+        _save_webp(storage, image, variant_name(name, THUMBNAIL))
+
+
+def _process(storage, name, model, field_name):
+    try:
+        generate_variants(storage, name)
+        # Закэшированные ответы и ETag ссылаются на оригинал.
+        if mark_variants_ready(model, field_name, name):
+            bump_recipes_version()
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        _in_progress.discard(name)
+
+
+def _process_in_worker(*args):
+    try:
+        _process(*args)
+    finally:
+        # Соединения с БД принадлежат потоку пула.
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def schedule_variants(field_file):
+    """Ставит обработку изображения в фоновую очередь."""
+    if not field_file or variants_ready(field_file):
+        return
+    name = field_file.name
+    if name in _in_progress:
+        return
+    _in_progress.add(name)
+    args = (field_file.storage, name, type(field_file.instance),
+            field_file.field.name)
+    if settings.IMAGE_VARIANTS_ASYNC:
+        _get_executor().submit(_process_in_worker, *args)
+    else:
+        _process(*args)
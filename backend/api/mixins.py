@@ -0,0 +1,166 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from api.replicas import primary_reads
+from recipes.cache import (get_recipes_modified, get_recipes_response_key,
+                           get_recipes_version)
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для list/retrieve.
+
+    Перед сериализацией выполняется дешевая проба: количество, максимальный
+    id и время изменения объектов выборки. Если клиент прислал совпадающий
+    If-None-Match, ответ 304 отдается без сериализации. В режиме курсора
+    пробы по всей выборке нет: ETag строится по строкам самой страницы.
+    Отфильтрованная выборка считается один раз и используется и для
+    пробы, и для ответа.
+    """
+
+    modified_field = None
+
+    def get_etag_parts(self, request):
+        return []
+
+    def make_etag(self, request, *parts):
+        parts = [
+            request.get_full_path(), get_recipes_version(),
+            *parts, *self.get_etag_parts(request),
+        ]
+        return quote_etag(md5(
+            ':'.join(map(str, parts)).encode(), usedforsecurity=False
+        ).hexdigest())
+
+    def get_conditional_state(self, request, queryset):
+        aggregates = {'count': Count('pk'), 'last': Max('pk')}
+        if self.modified_field:
+            aggregates['modified'] = Max(self.modified_field)
+        probe = queryset.order_by().aggregate(**aggregates)
+        modified = probe.pop('modified', None)
+        etag = self.make_etag(request, *probe.values(), modified)
+        recipes_modified = get_recipes_modified()
+        if (modified is None or recipes_modified is None
+                or request.user.is_authenticated):
+            return etag, None
+        # MAX(updated_at) не меняется при удалении рецепта или изменении
+        # связанных объектов, поэтому учитывается и время смены версии.
+        return etag, max(int(modified.timestamp()), recipes_modified)
+
+    def get_conditional_response(self, request, queryset, render):
+        etag, last_modified = self.get_conditional_state(request, queryset)
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        response = render(queryset)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def is_cursor_mode(self, request):
+        is_cursor_mode = getattr(self.paginator, 'is_cursor_mode', None)
+        return is_cursor_mode is not None and is_cursor_mode(request)
+
+    def get_page_conditional_response(self, request, queryset):
+        page = self.paginate_queryset(queryset)
+        modified = None
+        if self.modified_field and page:
+            modified = max(getattr(obj, self.modified_field) for obj in page)
+        etag = self.make_etag(
+            request, *(obj.pk for obj in page), modified)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        response = self.get_paginated_response(
+            self.get_serializer(page, many=True).data)
+        response['ETag'] = etag
+        return response
+
+    def render_list(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def render_retrieve(self, queryset):
+        instance = get_object_or_404(queryset)
+        self.check_object_permissions(self.request, instance)
+        return Response(self.get_serializer(instance).data)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.is_cursor_mode(request):
+            return self.get_page_conditional_response(request, queryset)
+        return self.get_conditional_response(
+            request, queryset, self.render_list)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: lookup})
+        except (TypeError, ValueError):
+            raise Http404
+        return self.get_conditional_response(
+            request, queryset, self.render_retrieve)
+
+
+class AnonymousCacheMixin:
+    """Ответы list/retrieve анонимным пользователям отдаются из кэша.
+
+    Вместе с данными кэшируются ETag и Last-Modified, поэтому повторные
+    и условные запросы обслуживаются без обращения к базе данных. Промах
+    кэша читает из основной базы, чтобы отстающая реплика не положила в
+    общий кэш устаревший ответ.
+    """
+
+    cached_headers = ('ETag', 'Last-Modified')
+
+    def get_cached_response(self, request, method, *args, **kwargs):
+        if request.user.is_authenticated:
+            return method(request, *args, **kwargs)
+        key = get_recipes_response_key(
+            request, self.action, kwargs.get(self.lookup_field))
+        cached = cache.get(key)
+        if cached is None:
+            with primary_reads():
+                response = method(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, (response.data, {
+                    header: response[header]
+                    for header in self.cached_headers if header in response
+                }), settings.RECIPES_CACHE_TIMEOUT)
+            return response
+        data, headers = cached
+        not_modified = get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(headers.get('Last-Modified')),
+        )
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().retrieve, *args, **kwargs)
@@ -0,0 +1,117 @@
+import threading
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from math import ceil
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+METRICS = ('wall', 'sql', 'serializer', 'queries')
+PERCENTILES = (50, 95, 99)
+
+
+class QueryTimer:
+    """Считает количество и суммарное время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += perf_counter() - started
+
+
+class ProfileStore:
+    """Последние замеры запросов, сгруппированные по view и action."""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=size))
+
+    def add(self, tag, sample):
+        with self._lock:
+            self._samples[tag].append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    @staticmethod
+    def percentile(values, percent):
+        return values[max(ceil(len(values) * percent / 100) - 1, 0)]
+
+    def report(self):
+        with self._lock:
+            samples = {tag: list(rows) for tag, rows in self._samples.items()}
+        report = {}
+        for tag, rows in sorted(samples.items()):
+            report[tag] = {'count': len(rows)}
+            for position, metric in enumerate(METRICS):
+                values = sorted(row[position] for row in rows)
+                report[tag][metric] = {
+                    f'p{percent}': round(self.percentile(values, percent), 2)
+                    for percent in PERCENTILES
+                }
+        return report
+
+
+profile_store = ProfileStore(settings.PROFILING_SAMPLE_SIZE)
+
+
+def get_view_tag(view_func, method):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class ProfilingMiddleware:
+    """Замеряет SQL, сериализацию и общее время обработки запроса.
+
+    Включается настройкой PROFILING_ENABLED. Время сериализации считается
+    как время работы view и рендеринга ответа за вычетом времени SQL.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request.profiling = {'timer': timer, 'tag': None, 'view': None}
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        finished = perf_counter()
+
+        wall = (finished - started) * 1000
+        sql = timer.duration * 1000
+        view_started = request.profiling['view']
+        serializer = (
+            max((finished - view_started) * 1000 - sql, 0)
+            if view_started else 0
+        )
+        tag = request.profiling['tag'] or request.path
+        profile_store.add(tag, (wall, sql, serializer, timer.count))
+        if settings.PROFILING_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={sql:.2f};desc="{timer.count} queries", '
+                f'serializer;dur={serializer:.2f}, total;dur={wall:.2f}'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.profiling['tag'] = get_view_tag(
+            view_func, request.method.lower())
+        request.profiling['view'] = perf_counter()
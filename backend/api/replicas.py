@@ -0,0 +1,104 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+PRIMARY_PIN_KEY = 'primary_pin:{}'
+
+# Реплика, из которой читает текущий запрос, или None - основная база.
+replica_alias = ContextVar('replica_alias', default=None)
+
+
+@contextmanager
+def primary_reads():
+    """Внутри блока все чтения идут в основную базу."""
+    token = replica_alias.set(None)
+    try:
+        yield
+    finally:
+        replica_alias.reset(token)
+
+
+class ReplicaRouter:
+    """Отправляет чтения в реплики, если их разрешил ReplicaMiddleware.
+
+    Запись, миграции и все запросы вне HTTP (команды, миграции, фоновые
+    задачи) работают с основной базой.
+    """
+
+    def db_for_read(self, model, **hints):
+        return replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+def get_pin_key(token):
+    return PRIMARY_PIN_KEY.format(
+        md5(token.encode(), usedforsecurity=False).hexdigest())
+
+
+def get_request_token(request):
+    """Токен из заголовка Authorization или None у анонимного клиента.
+
+    Адрес клиента для закрепления не подходит: за nginx у всех запросов
+    один REMOTE_ADDR.
+    """
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    return parts[1] if len(parts) == 2 else None
+
+
+def get_issued_token(response):
+    """Токен, выданный ответом на вход (djoser token/login)."""
+    data = getattr(response, 'data', None)
+    return data.get('auth_token') if isinstance(data, dict) else None
+
+
+class ReplicaMiddleware:
+    """Безопасные запросы к API читают из реплик.
+
+    Реплика выбирается один раз на запрос, поэтому все его чтения видят
+    один и тот же снимок. После POST/PUT/PATCH/DELETE клиент с токеном на
+    REPLICA_STICKY_SECONDS закрепляется за основной базой, чтобы сразу
+    видеть свои изменения, даже если реплика отстает. Токен, выданный при
+    входе, закрепляется сразу. Закрепление хранится в кэше, поэтому при
+    нескольких воркерах кэш должен быть общим.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        token = get_request_token(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            tokens = {token, get_issued_token(response)} - {None}
+            if tokens:
+                cache.set_many(
+                    {get_pin_key(token): True for token in tokens},
+                    settings.REPLICA_STICKY_SECONDS,
+                )
+            return response
+        alias = None
+        if (
+            request.path.startswith(settings.REPLICA_PATH_PREFIXES)
+            and not (token and cache.get(get_pin_key(token)))
+        ):
+            alias = random.choice(settings.REPLICA_DATABASES)
+        context_token = replica_alias.set(alias)
+        try:
+            return self.get_response(request)
+        finally:
+            replica_alias.reset(context_token)
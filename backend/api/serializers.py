@@ -1,10 +1,27 @@
+from collections import defaultdict
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import F, Manager, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from api.fields import Base64ImageField
-from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from api.fields import Base64ImageField, ImageVariantField
+from api.images import THUMBNAIL, delete_image
+from recipes.cache import get_recipe_state
+from recipes.constants import (BULK_MAX_ITEMS, MATCH_LIMIT,
+                               MATCH_MAX_INGREDIENTS, MATCH_MAX_LIMIT,
+                               MAX_SERVINGS, MIN_SERVINGS)
+from recipes.counters import increment
+from recipes.lists import add_to_list, remove_from_list, set_servings
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import build_search_vector
+from recipes.shopping_list import (batch_shopping_list_changes,
+                                   recipe_ingredients_changed)
 from users.models import Subscription
 from users.serializers import UserSerializer
 
@@ -13,7 +30,7 @@ User = get_user_model()
 
 class FavouriteAndShoppingCrtSerializer(serializers.ModelSerializer):
     """Сериализация избранного и корзины покупок."""
-    image = Base64ImageField()
+    image = ImageVariantField(variant=THUMBNAIL)
 
     class Meta:
         model = Recipe
@@ -25,6 +42,48 @@ class FavouriteAndShoppingCrtSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeMatchSerializer(FavouriteAndShoppingCrtSerializer):
+    """Сериализация рецепта, подобранного по ингредиентам."""
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(FavouriteAndShoppingCrtSerializer.Meta):
+        fields = FavouriteAndShoppingCrtSerializer.Meta.fields + (
+            'matched', 'missing')
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Список id для пакетных операций."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_ITEMS,
+        error_messages={'empty': 'Передайте хотя бы один id.'},
+    )
+
+
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по ингредиентам."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MATCH_MAX_INGREDIENTS,
+        error_messages={'empty': 'Укажите хотя бы один ингредиент.'},
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=MATCH_MAX_LIMIT, default=MATCH_LIMIT)
+
+    def to_internal_value(self, data):
+        ingredients = [
+            value
+            for item in data.getlist('ingredients')
+            for value in item.split(',') if value
+        ]
+        return super().to_internal_value({
+            **data.dict(), 'ingredients': ingredients})
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализация тегов."""
     class Meta:
@@ -82,6 +141,18 @@ class CreateIngredientInRecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """Сериализация строки списка покупок."""
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализация ингредиентов."""
     amount = RecipeIngredientSerializer(read_only=True)
@@ -100,6 +171,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(required=False)
+    image = ImageVariantField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
 
@@ -115,17 +187,23 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         return request.user if request else None
 
+    def get_recipe_state(self):
+        if 'recipe_state' not in self.context:
+            user = self.get_user()
+            self.context['recipe_state'] = (
+                get_recipe_state(user)
+                if user and user.is_authenticated
+                else (frozenset(), frozenset())
+            )
+        return self.context['recipe_state']
+
     def get_is_favorited(self, obj):
-        user = self.get_user()
-        if user and not user.is_anonymous:
-            return obj.favorites.filter(user=user).exists()
-        return False
+        favorites, _ = self.get_recipe_state()
+        return obj.pk in favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.get_user()
-        if user and not user.is_anonymous:
-            return obj.shopping_carts.filter(user=user).exists()
-        return False
+        _, shopping_cart = self.get_recipe_state()
+        return obj.pk in shopping_cart
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -148,7 +226,6 @@ class RecipeSerializer(serializers.ModelSerializer):
     def _set_ingredients_and_tags(validated_data, recipe):
         ingredients = validated_data.pop('recipe_ingredients', [])
         tags = validated_data.pop('tags', [])
-        recipe.tags.set(tags)
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
@@ -156,28 +233,93 @@ class RecipeSerializer(serializers.ModelSerializer):
                 amount=ingredient.get('amount'),
             ) for ingredient in ingredients
         )
+        recipe.tags.set(tags)
 
+    @transaction.atomic
     def create(self, validated_data):
+        author = self.context.get('request').user
+        # search_vector пишется тем же INSERT: названия ингредиентов уже
+        # загружены при валидации.
+        search_vector = build_search_vector(
+            validated_data['name'],
+            self._ingredient_names(validated_data['recipe_ingredients']),
+            validated_data['text'],
+        )
         recipe = Recipe.objects.create(
-            author=self.context.get('request').user,
+            author=author,
             image=validated_data.pop('image'),
             name=validated_data.pop('name'),
             text=validated_data.pop('text'),
-            cooking_time=validated_data.pop('cooking_time'), )
+            cooking_time=validated_data.pop('cooking_time'),
+            search_vector=search_vector, )
         self._set_ingredients_and_tags(
             validated_data,
             recipe
         )
+        increment(User, author.pk, 'recipes_count')
         return recipe
 
+    @staticmethod
+    def _ingredient_names(ingredients):
+        return [ingredient['ingredient'].name for ingredient in ingredients]
+
+    @staticmethod
+    def _update_ingredients(recipe, ingredients):
+        """Применяет к ингредиентам рецепта только разницу со списком.
+
+        Списки покупок получают приращения всех изменений одним запросом.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+        changed = []
+        created = []
+        deltas = []
+        for ingredient in ingredients:
+            item = current.pop(ingredient['ingredient'].pk, None)
+            if item is None:
+                created.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient['ingredient'],
+                    amount=ingredient['amount'],
+                ))
+            elif item.amount != ingredient['amount']:
+                deltas.append((recipe.pk, item.ingredient_id,
+                               ingredient['amount'] - item.amount))
+                item.amount = ingredient['amount']
+                changed.append(item)
+        with batch_shopping_list_changes():
+            if current:
+                # Удаление отправляет сигналы, их приращения попадут в пачку.
+                RecipeIngredient.objects.filter(
+                    pk__in=[item.pk for item in current.values()]).delete()
+            # bulk_update и bulk_create сигналов не отправляют.
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+            RecipeIngredient.objects.bulk_create(created)
+            recipe_ingredients_changed(deltas + [
+                (recipe.pk, item.ingredient_id, item.amount)
+                for item in created
+            ])
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        instance.tags.clear()
-        self._set_ingredients_and_tags(
-            validated_data,
-            instance,
-        )
-        return super().update(instance, validated_data)
+        old_image = instance.image.name
+        ingredients = validated_data.pop('recipe_ingredients', [])
+        self._update_ingredients(instance, ingredients)
+        instance.tags.set(validated_data.pop('tags', []))
+        serializers.raise_errors_on_nested_writes(
+            'update', self, validated_data)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.search_vector = build_search_vector(
+            instance.name, self._ingredient_names(ingredients), instance.text)
+        instance.save(
+            update_fields=[*validated_data, 'updated_at', 'search_vector'])
+        if old_image and old_image != instance.image.name:
+            transaction.on_commit(
+                partial(delete_image, instance.image.storage, old_image))
+        return instance
 
     def to_representation(self, instance):
         return RecipeReadSerializer(instance).data
@@ -219,36 +361,70 @@ class RecipeSerializer(serializers.ModelSerializer):
         return value
 
 
+class SubscribingListSerializer(serializers.ListSerializer):
+    """Загружает превью рецептов для всей страницы авторов одним запросом."""
+
+    def to_representation(self, data):
+        authors = list(data.all() if isinstance(data, Manager) else data)
+        # search_vector в превью не нужен, а это самая большая колонка.
+        recipes = Recipe.objects.defer('search_vector').filter(
+            author__in=authors)
+        limit = self.child.get_recipes_limit()
+        if limit is not None:
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=F('id').desc(),
+            )).filter(row_number__lte=limit)
+        previews = defaultdict(list)
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipe_previews = previews[author.pk]
+        return super().to_representation(authors)
+
+
 class SubscribingSerializer(serializers.ModelSerializer):
     """Сериализация подписчика."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='recipes.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'avatar', 'is_subscribed', 'recipes', 'recipes_count')
         read_only_fields = ('id',)
+        list_serializer_class = SubscribingListSerializer
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             user=self.context['request'].user,
             subscribing=obj).exists()
 
+    def get_recipes_count(self, obj):
+        return obj.recipes_count
+
+    def get_recipes_limit(self):
+        try:
+            return int(
+                self.context['request'].query_params['recipes_limit'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        queryset = obj.recipes.all()
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            try:
-                queryset = queryset[:int(limit)]
-            except (TypeError, ValueError):
-                pass
+        queryset = getattr(obj, 'recipe_previews', None)
+        if queryset is None:
+            queryset = obj.recipes.defer('search_vector')
+            limit = self.get_recipes_limit()
+            if limit is not None:
+                queryset = queryset[:limit]
         return FavouriteAndShoppingCrtSerializer(
             queryset,
             many=True,
-            context={'request': request},
+            context=self.context,
         ).data
 
 
@@ -274,6 +450,12 @@ class SubscribeSerializer(serializers.ModelSerializer):
             )
         return data
 
+    @transaction.atomic
+    def create(self, validated_data):
+        subscription = super().create(validated_data)
+        increment(User, subscription.subscribing_id, 'subscribers_count')
+        return subscription
+
     def to_representation(self, instance):
         return SubscribingSerializer(
             instance.subscribing,
@@ -281,69 +463,80 @@ class SubscribeSerializer(serializers.ModelSerializer):
         ).data
 
 
-class FavouriteSerializer(serializers.ModelSerializer):
-    """Сериализация избранного."""
+class UserRecipeListSerializer(serializers.ModelSerializer):
+    """Добавление рецепта в список пользователя и удаление из него.
+
+    Каждая операция - один запрос к БД: повторное добавление отсекается
+    ограничением уникальности, а не предварительной проверкой.
+    """
+    list_model = None
+    counter = None
+    exists_message = None
+    absent_message = None
 
     class Meta:
         model = Recipe
-        fields = (
-            'id',
-        )
+        fields = ('id',)
 
-    def validate(self, data):
-        user = self.context['request'].user
-        pk = self.context['id']
-        recipe = get_object_or_404(Recipe, id=pk)
-        if recipe.favorites.filter(user=user).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже был добавлен в избранное.')
-        return data
+    def get_recipe_id(self):
+        try:
+            return int(self.context['id'])
+        except (TypeError, ValueError):
+            raise Http404
 
     def create(self, validated_data):
-        user = self.context['request'].user
-        pk = self.context['id']
-        recipe = get_object_or_404(Recipe, id=pk)
-        favourite_item = user.favorites.create(recipe=recipe)
-        return favourite_item.recipe
+        try:
+            recipe = add_to_list(
+                self.list_model, self.counter,
+                self.context['request'].user, self.get_recipe_id(),
+                **validated_data)
+        except Recipe.DoesNotExist:
+            raise Http404
+        if recipe is None:
+            raise serializers.ValidationError(self.exists_message)
+        return recipe
 
     def delete(self, user):
-        pk = self.context['id']
-        recipe = get_object_or_404(Recipe, id=pk)
-        favourite = user.favorites.filter(recipe=recipe).first()
-        if not favourite:
-            raise serializers.ValidationError(
-                'Рецепт уже был удален из избранного.')
-        favourite.delete()
+        try:
+            removed = remove_from_list(
+                self.list_model, self.counter, user, self.get_recipe_id())
+        except Recipe.DoesNotExist:
+            raise Http404
+        if not removed:
+            raise serializers.ValidationError(self.absent_message)
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериализация корзины покупок."""
+class FavouriteSerializer(UserRecipeListSerializer):
+    """Сериализация избранного."""
+    list_model = Favourite
+    counter = 'favorites_count'
+    exists_message = 'Рецепт уже был добавлен в избранное.'
+    absent_message = 'Рецепт уже был удален из избранного.'
 
-    class Meta:
-        model = Recipe
-        fields = ('id',)
 
-    def validate(self, data):
-        user = self.context['request'].user
-        pk = self.context['id']
-        recipe = get_object_or_404(Recipe, id=pk)
-        if recipe.shopping_carts.filter(user=user).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже был добавлен в корзину.')
-        return data
+class ShoppingCartSerializer(UserRecipeListSerializer):
+    """Сериализация корзины покупок."""
+    list_model = ShoppingCart
+    counter = 'shopping_carts_count'
+    exists_message = 'Рецепт уже был добавлен в корзину.'
+    absent_message = 'Рецепт уже был удален из корзины.'
+    servings = serializers.IntegerField(
+        min_value=MIN_SERVINGS, max_value=MAX_SERVINGS,
+        required=False, write_only=True,
+    )
 
-    def create(self, validated_data):
-        user = self.context['request'].user
-        pk = self.context['id']
-        recipe = get_object_or_404(Recipe, id=pk)
-        shopping_cart_item = user.shopping_carts.create(recipe=recipe)
-        return shopping_cart_item.recipe
+    class Meta(UserRecipeListSerializer.Meta):
+        fields = ('id', 'servings')
 
-    def delete(self, user):
-        pk = self.context['id']
-        recipe = get_object_or_404(Recipe, id=pk)
-        shopping_cart_item = user.shopping_carts.filter(recipe=recipe).first()
-        if not shopping_cart_item:
+    def update_servings(self, user):
+        servings = self.validated_data.get('servings')
+        if servings is None:
             raise serializers.ValidationError(
-                'Рецепт уже был удален из корзины.')
-        shopping_cart_item.delete()
+                'Не указан множитель порций.')
+        try:
+            updated = set_servings(user, self.get_recipe_id(), servings)
+        except Recipe.DoesNotExist:
+            raise Http404
+        if not updated:
+            raise serializers.ValidationError('Рецепта нет в корзине.')
+        return servings
@@ -0,0 +1,25 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from api.images import schedule_variants
+from recipes.models import Recipe
+from users.models import User
+
+
+def process_image(field_file, update_fields):
+    if field_file and (
+            update_fields is None or field_file.field.name in update_fields):
+        transaction.on_commit(partial(schedule_variants, field_file))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, update_fields=None, **kwargs):
+    process_image(instance.image, update_fields)
+
+
+@receiver(post_save, sender=User)
+def process_user_avatar(sender, instance, update_fields=None, **kwargs):
+    process_image(instance.avatar, update_fields)
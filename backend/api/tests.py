@@ -0,0 +1,689 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from api.filters import RecipeFilter
+from api.images import schedule_variants, variants_ready
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.popularity import refresh_popularity
+from users.models import Subscription, User
+from users.paginators import approximate_count
+
+PAGE_SIZE = 100
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель', password='pass',
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Автор', last_name='Автор', password='pass',
+            )
+            for number in range(5)
+        ]
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(10)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {number}', text='Описание', cooking_time=10,
+                author=authors[number % len(authors)],
+            )
+            for number in range(PAGE_SIZE)
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags[:2]
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in recipes for ingredient in ingredients[:3]
+        )
+        Favourite.objects.bulk_create(
+            Favourite(user=cls.user, recipe=recipe) for recipe in recipes[::2])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3])
+        Subscription.objects.create(user=cls.user, subscribing=authors[0])
+        cls.authors = authors
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, queries, limit=PAGE_SIZE):
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def test_anonymous_page(self):
+        # Проба ETag, COUNT, страница, ингредиенты, теги, авторы.
+        self.get_page(6, limit=10)
+        self.get_page(6)
+
+    def test_authenticated_page(self):
+        # Плюс подписки для ETag и id рецептов в избранном и корзине.
+        self.client.force_authenticate(self.user)
+        self.get_page(9, limit=10)
+        cache.clear()
+        response = self.get_page(9)
+        recipes = response.data['results']
+        self.assertEqual(
+            sum(recipe['is_favorited'] for recipe in recipes), PAGE_SIZE // 2)
+        self.assertTrue(any(
+            recipe['author']['is_subscribed'] for recipe in recipes))
+
+    def test_previews_skip_search_vector(self):
+        self.client.force_authenticate(self.user)
+        subscribe = f'/api/users/{self.authors[0].pk}/subscribe/'
+        self.client.delete(subscribe)
+        requests = (
+            ('get', '/api/recipes/'),
+            ('get', '/api/users/subscriptions/'),
+            ('post', subscribe),
+        )
+        for method, url in requests:
+            with self.subTest(url), CaptureQueriesContext(
+                    connection) as queries:
+                response = getattr(self.client, method)(url)
+            self.assertLess(response.status_code, 300)
+            self.assertFalse(any(
+                'search_vector' in query['sql']
+                for query in queries.captured_queries))
+
+    def test_cursor_page_without_count(self):
+        # Теги, страница, ингредиенты, теги рецептов, авторы: без пробы
+        # COUNT по всей выборке и без повторной фильтрации.
+        with self.assertNumQueries(5) as queries:
+            response = self.client.get('/api/recipes/', {
+                'pagination': 'cursor', 'tags': 'tag0', 'limit': PAGE_SIZE,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), PAGE_SIZE)
+        self.assertFalse(any(
+            'COUNT' in query['sql'] for query in queries.captured_queries))
+        response = self.client.get(
+            '/api/recipes/',
+            {'pagination': 'cursor', 'tags': 'tag0', 'limit': PAGE_SIZE},
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class RecipeConditionalGetTest(APITestCase):
+    """Last-Modified списка меняется при удалении рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор', password='pass',
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {number}', text='Описание',
+                   cooking_time=10, author=cls.author)
+            for number in range(2)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_delete_invalidates_last_modified(self):
+        response = self.client.get('/api/recipes/')
+        last_modified = response['Last-Modified']
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/recipes/{self.recipes[0].pk}/')
+        self.client.force_authenticate(None)
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+
+
+class RecipeFilterIndexTest(TestCase):
+    """Фильтры списка рецептов используют составные индексы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор', password='pass',
+        )
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(3)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {number}', text='Описание',
+                   cooking_time=10, author=cls.author)
+            for number in range(10)
+        )
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in cls.tags[:2]
+        )
+
+    def filter_recipes(self, **data):
+        return RecipeFilter(data=data, queryset=Recipe.objects.all()).qs
+
+    def explain(self, queryset):
+        """План запроса.
+
+        На маленьких таблицах PostgreSQL выбирает полный просмотр, поэтому
+        он отключается на время EXPLAIN.
+        """
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                return queryset.explain()
+            finally:
+                cursor.execute('RESET enable_seqscan')
+
+    def test_tag_filter_uses_index(self):
+        queryset = self.filter_recipes(tags=['tag0', 'tag1'])
+        self.assertIn('recipe_tag_idx', self.explain(queryset))
+
+    def test_tag_filter_does_not_duplicate_rows(self):
+        ids = list(self.filter_recipes(
+            tags=['tag0', 'tag1']).values_list('id', flat=True))
+        self.assertEqual(len(ids), 10)
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_author_filter_uses_index(self):
+        queryset = self.filter_recipes(author=self.author.pk)
+        self.assertIn('recipe_author_idx', self.explain(queryset))
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'recipe_popular_idx создается только в PostgreSQL')
+    def test_popular_ordering_uses_index(self):
+        queryset = self.filter_recipes(ordering='popular')[:PAGE_SIZE]
+        self.assertIn('recipe_popular_idx', self.explain(queryset))
+
+    def test_popular_ordering(self):
+        recipes = list(Recipe.objects.order_by('id'))
+        Favourite.objects.create(user=self.author, recipe=recipes[3])
+        ShoppingCart.objects.create(user=self.author, recipe=recipes[3])
+        Favourite.objects.create(user=self.author, recipe=recipes[5])
+        refresh_popularity(full=True)
+        ordered = list(self.filter_recipes(ordering='popular'))
+        self.assertEqual(ordered[:2], [recipes[3], recipes[5]])
+        self.assertEqual(ordered[2:], [
+            recipe for recipe in reversed(recipes)
+            if recipe not in (recipes[3], recipes[5])
+        ])
+        self.assertIsNone(ordered[-1].popularity_score)
+
+
+class ShoppingListDownloadTest(APITestCase):
+    """ETag выгрузки списка покупок меняется вместе с количествами."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            first_name='Покупатель', last_name='Покупатель', password='pass',
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10, author=cls.user)
+        cls.ingredient = Ingredient.objects.create(
+            name='Мука', measurement_unit='шт.')
+        cls.item = RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=100)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, **headers):
+        return self.client.get('/api/recipes/download_shopping_cart/',
+                               **headers)
+
+    def assertModified(self, etag, amount):
+        response = self.download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(f'Мука, (шт.) — {amount}',
+                      b''.join(response.streaming_content).decode())
+
+    def test_not_modified_keeps_etag(self):
+        etag = self.download()['ETag']
+        response = self.download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_ingredient_amount_change(self):
+        etag = self.download()['ETag']
+        self.item.amount = 250
+        self.item.save()
+        self.assertModified(etag, 250)
+
+    def test_servings_change(self):
+        etag = self.download()['ETag']
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            {'servings': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertModified(etag, 300)
+
+
+class RecipeListsTest(APITestCase):
+    """Добавление в избранное и корзину и удаление из них.
+
+    В PostgreSQL это запросы с CTE, на других базах - ORM.
+    """
+
+    LISTS = (
+        ('favorite', Favourite, 'favorites_count'),
+        ('shopping_cart', ShoppingCart, 'shopping_carts_count'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель', password='pass',
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', cooking_time=10, author=cls.user)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assertListState(self, model, counter, count):
+        self.assertEqual(
+            model.objects.filter(user=self.user, recipe=self.recipe).count(),
+            count)
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), count)
+
+    def test_add_and_remove(self):
+        for path, model, counter in self.LISTS:
+            with self.subTest(path):
+                url = f'/api/recipes/{self.recipe.pk}/{path}/'
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(response.data['id'], self.recipe.pk)
+                self.assertEqual(response.data['name'], self.recipe.name)
+                self.assertListState(model, counter, 1)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertListState(model, counter, 1)
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertListState(model, counter, 0)
+                self.assertEqual(self.client.delete(url).status_code, 400)
+                self.assertListState(model, counter, 0)
+
+    def test_missing_recipe(self):
+        missing = self.recipe.pk + 1000
+        for path, _, _ in self.LISTS:
+            with self.subTest(path):
+                url = f'/api/recipes/{missing}/{path}/'
+                self.assertEqual(self.client.post(url).status_code, 404)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_servings(self):
+        url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        response = self.client.post(url, {'servings': 3}, format='json')
+        self.assertEqual(response.status_code, 201)
+        cart = ShoppingCart.objects.get(user=self.user, recipe=self.recipe)
+        self.assertEqual(cart.servings, 3)
+        response = self.client.patch(url, {'servings': 2}, format='json')
+        self.assertEqual(response.status_code, 200)
+        cart.refresh_from_db()
+        self.assertEqual(cart.servings, 2)
+        self.client.delete(url)
+        response = self.client.patch(url, {'servings': 2}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk + 1000}/shopping_cart/',
+            {'servings': 2}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class BulkListsTest(APITestCase):
+    """Пакетное добавление и удаление: статусы по id и счетчики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass',
+            )
+            for name in ('reader', 'author')
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {number}', text='Описание',
+                   cooking_time=10, author=cls.author)
+            for number in range(3)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [(row['id'], row['status']) for row in response.data['results']]
+
+    def assertCounters(self, counter, expected):
+        self.assertEqual(
+            list(Recipe.objects.filter(pk__in=[
+                recipe.pk for recipe in self.recipes
+            ]).order_by('pk').values_list(counter, flat=True)),
+            expected)
+
+    def test_recipe_lists(self):
+        first, second, third = (recipe.pk for recipe in self.recipes)
+        missing = third + 1000
+        for path, counter in (('favorite', 'favorites_count'),
+                              ('shopping_cart', 'shopping_carts_count')):
+            with self.subTest(path):
+                url = f'/api/recipes/{path}/'
+                self.client.post(f'/api/recipes/{first}/{path}/')
+                self.assertEqual(
+                    self.send('post', url, [first, second, second, missing]),
+                    [(first, 'exists'), (second, 'added'),
+                     (missing, 'not_found')])
+                self.assertCounters(counter, [1, 1, 0])
+                self.assertEqual(
+                    self.send('delete', url, [second, third, missing]),
+                    [(second, 'removed'), (third, 'absent'),
+                     (missing, 'absent')])
+                self.assertCounters(counter, [1, 0, 0])
+
+    def test_subscriptions(self):
+        url = '/api/users/subscribe/'
+        missing = self.author.pk + 1000
+        self.assertEqual(
+            self.send('post', url, [self.author.pk, self.user.pk, missing]),
+            [(self.author.pk, 'added'), (self.user.pk, 'forbidden'),
+             (missing, 'not_found')])
+        self.assertEqual(self.send('post', url, [self.author.pk]),
+                         [(self.author.pk, 'exists')])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.assertEqual(self.send('delete', url, [self.author.pk]),
+                         [(self.author.pk, 'removed')])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+
+class ShoppingListDeltasTest(APITestCase):
+    """Материализованный список совпадает с агрегацией корзины.
+
+    В PostgreSQL приращения применяются INSERT ... ON CONFLICT DO UPDATE,
+    на других базах - через ORM.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.first, cls.second = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                first_name='Имя', last_name='Фамилия', password='pass',
+            )
+            for name in ('author', 'first', 'second')
+        )
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(4)
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {number}', text='Описание',
+                   cooking_time=10, author=cls.author)
+            for number in range(2)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=10 * (number + 1))
+            for recipe in cls.recipes
+            for number, ingredient in enumerate(cls.ingredients[:3])
+        )
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+    def assertListsMatch(self):
+        for user in (self.first, self.second):
+            expected = dict(
+                RecipeIngredient.objects
+                .filter(recipe__shopping_carts__user=user)
+                .values_list('ingredient')
+                .annotate(total=Sum(
+                    F('amount') * F('recipe__shopping_carts__servings')))
+                .values_list('ingredient', 'total')
+            )
+            self.assertEqual(
+                dict(user.shopping_list.values_list('ingredient', 'amount')),
+                expected)
+
+    def cart_url(self, recipe):
+        return f'/api/recipes/{recipe.pk}/shopping_cart/'
+
+    def test_cart_changes(self):
+        first, second = self.recipes
+        self.as_user(self.first).post(
+            self.cart_url(first), {'servings': 2}, format='json')
+        self.as_user(self.second).post(self.cart_url(first))
+        self.client.post(self.cart_url(second))
+        self.assertListsMatch()
+        self.as_user(self.first).patch(
+            self.cart_url(first), {'servings': 3}, format='json')
+        self.assertListsMatch()
+        ids = {'ids': [first.pk, second.pk]}
+        self.as_user(self.second).delete(
+            '/api/recipes/shopping_cart/', ids, format='json')
+        self.assertListsMatch()
+        self.assertFalse(self.second.shopping_list.exists())
+        self.client.post('/api/recipes/shopping_cart/', ids, format='json')
+        self.assertListsMatch()
+        self.as_user(self.first).delete(self.cart_url(first))
+        self.assertListsMatch()
+        self.assertFalse(self.first.shopping_list.exists())
+
+    def test_recipe_changes(self):
+        first, second = self.recipes
+        self.as_user(self.first).post(
+            self.cart_url(first), {'servings': 2}, format='json')
+        self.as_user(self.second).post(self.cart_url(first))
+        self.client.post(self.cart_url(second))
+        ingredients = self.ingredients
+        response = self.as_user(self.author).patch(
+            f'/api/recipes/{first.pk}/',
+            {
+                'tags': [self.tag.pk],
+                'ingredients': [
+                    {'id': ingredients[0].pk, 'amount': 25},
+                    {'id': ingredients[2].pk, 'amount': 30},
+                    {'id': ingredients[3].pk, 'amount': 5},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertListsMatch()
+        self.assertEqual(
+            self.first.shopping_list.get(ingredient=ingredients[0]).amount,
+            50)
+        self.assertFalse(self.first.shopping_list.filter(
+            ingredient=ingredients[1]).exists())
+        response = self.client.delete(f'/api/recipes/{second.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertListsMatch()
+
+
+class ApproximateCountTest(APITestCase):
+    """Оценка количества без статистики сводится к точному COUNT(*)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор', password='pass',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(name=f'Рецепт {number}', text='Описание',
+                   cooking_time=10, author=author)
+            for number in range(3)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_table_without_statistics(self):
+        # Тестовые таблицы еще не анализировались: reltuples в
+        # PostgreSQL 13 равен 0, в 14+ - -1.
+        self.assertEqual(approximate_count(Recipe.objects.all()), 3)
+        response = self.client.get('/api/recipes/', {'count': 'approximate'})
+        self.assertEqual(response.data['count'], 3)
+
+
+class RecipeWriteQueriesTest(APITestCase):
+    """Запись рецепта: search_vector пишется тем же INSERT или UPDATE."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор', password='pass',
+        )
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Продукт {number}', measurement_unit='г')
+            for number in range(2)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def get_data(self, *ingredients):
+        return {
+            'name': 'Борщ', 'text': 'Описание', 'cooking_time': 30,
+            'image': None, 'tags': [self.tag.pk],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 100}
+                for ingredient in ingredients
+            ],
+        }
+
+    def get_writes(self, queries):
+        return [
+            query['sql'].split()[0] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def test_create(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/recipes/', self.get_data(*self.ingredients),
+                format='json')
+        self.assertEqual(response.status_code, 201)
+        # Рецепт, его ингредиенты, теги и счетчик рецептов автора.
+        self.assertEqual(self.get_writes(queries),
+                         ['INSERT', 'INSERT', 'INSERT', 'UPDATE'])
+        self.assertEqual(
+            Recipe.objects.filter(
+                author=self.author, name='Борщ').count(), 1)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        if connection.vendor == 'postgresql':
+            self.assertTrue(Recipe.objects.filter(
+                search_vector='продукт').exists())
+
+    def test_update(self):
+        self.client.post(
+            '/api/recipes/', self.get_data(self.ingredients[0]),
+            format='json')
+        recipe = Recipe.objects.get(author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                self.get_data(*self.ingredients), format='json')
+        self.assertEqual(response.status_code, 200)
+        # Рецепт обновляется одним UPDATE вместе с search_vector.
+        self.assertEqual(len([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE "recipes_recipe"')
+        ]), 1)
+
+
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantsTest(APITestCase):
+    """Готовность вариантов изображения берется из строки рецепта."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+        author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор', password='pass',
+        )
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.recipe = Recipe(name='Рецепт', text='Описание',
+                             cooking_time=10, author=author)
+        self.recipe.image.save(
+            'dish.png', ContentFile(buffer.getvalue()), save=False)
+        self.recipe.save()
+
+    def get_image(self, **headers):
+        # Список не должен обращаться к хранилищу за каждой картинкой.
+        with mock.patch.object(FileSystemStorage, 'exists') as exists:
+            response = self.client.get('/api/recipes/', **headers)
+        exists.assert_not_called()
+        return response
+
+    def test_thumbnail_after_generation(self):
+        response = self.get_image()
+        self.assertTrue(response.data['results'][0]['image'].endswith(
+            self.recipe.image.name))
+        schedule_variants(self.recipe.image)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, self.recipe.image.name)
+        updated = self.get_image(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(updated.status_code, 200)
+        self.assertTrue(updated.data['results'][0]['image'].endswith(
+            '_thumb.webp'))
+
+    def test_replaced_image_is_not_ready(self):
+        schedule_variants(self.recipe.image)
+        self.recipe.refresh_from_db()
+        self.assertTrue(variants_ready(self.recipe.image))
+        self.recipe.image.name = 'recipes/images/other.png'
+        self.assertFalse(variants_ready(self.recipe.image))
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from api.views import (IngredientViewSet, ProfilingView, RecipeViewSet,
+                       TagViewSet)
 from users.views import UserViewSet
 
 router_v1 = routers.DefaultRouter()
@@ -11,6 +12,7 @@ router_v1.register('recipes', RecipeViewSet, basename='recipes')
 router_v1.register('users', UserViewSet, basename='users')
 
 urlpatterns = [
+    path('profiling/', ProfilingView.as_view(), name='profiling'),
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,6 +1,11 @@
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
+from hashlib import md5
+
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
@@ -8,31 +13,86 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from api.bulk import ADDED, bulk_add, bulk_remove
+from api.exporters import (SHOPPING_CART_FILENAME, SHOPPING_CART_FORMATS,
+                           ExportContentNegotiation)
 from api.filters import IngredientFilter, RecipeFilter
+from api.mixins import AnonymousCacheMixin, ConditionalGetMixin
 from api.permissions import AuthorOrReadOnly
-from api.serializers import (FavouriteAndShoppingCrtSerializer,
+from api.profiling import profile_store
+from api.serializers import (BulkIdsSerializer,
+                             FavouriteAndShoppingCrtSerializer,
                              FavouriteSerializer, IngredientSerializer,
+                             RecipeMatchQuerySerializer, RecipeMatchSerializer,
                              RecipeReadSerializer, RecipeSerializer,
-                             ShoppingCartSerializer, TagSerializer)
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+                             ShoppingCartSerializer,
+                             ShoppingListItemSerializer, TagSerializer)
+from recipes.autocomplete import ingredient_index
+from recipes.cache import get_recipe_state, invalidate_recipe_state
+from recipes.constants import AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT
+from recipes.counters import decrement
+from recipes.links import decode_base62, get_full_link
+from recipes.lists import RECIPE_FIELDS
+from recipes.matching import recipe_match_index
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.shopping_list import batch_shopping_list_changes, carts_changed
+from recipes.units import normalize_shopping_list
+from users.models import Subscription, User
 from users.views import CustomPagination
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+class RecipeViewSet(AnonymousCacheMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
+    queryset = Recipe.objects.defer('search_vector')
+    modified_field = 'updated_at'
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = [AuthorOrReadOnly, IsAuthenticatedOrReadOnly]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        authors = User.objects.all()
+        queryset = queryset.prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+            'tags',
+        )
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, subscribing=OuterRef('pk'))
+            ))
+        return queryset.prefetch_related(Prefetch('author', queryset=authors))
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeSerializer
 
+    def get_etag_parts(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return []
+        subscriptions = Subscription.objects.filter(user=user).aggregate(
+            count=Count('id'), last=Max('id'))
+        return [user.pk, hash(get_recipe_state(user)),
+                *subscriptions.values()]
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        decrement(User, instance.author_id, 'recipes_count')
+
     @action(detail=True, methods=['post'], url_path='favorite',
             permission_classes=[permissions.IsAuthenticated])
     def favorite_post(self, request, pk):
@@ -47,10 +107,68 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def shopping_cart_post(self, request, pk):
         return self.add_item_to_list(request.user, pk, 'shopping_cart')
 
+    @shopping_cart_post.mapping.patch
+    def shopping_cart_patch(self, request, pk):
+        serializer = ShoppingCartSerializer(
+            data=request.data, context={'request': request, 'id': pk})
+        serializer.is_valid(raise_exception=True)
+        try:
+            servings = serializer.update_servings(request.user)
+        except serializers.ValidationError as e:
+            return Response(
+                {'errors': str(e)}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'id': int(pk), 'servings': servings},
+                        status=status.HTTP_200_OK)
+
     @shopping_cart_post.mapping.delete
     def shopping_cart_delete(self, request, pk):
         return self.remove_item_from_list(request.user, pk, 'shopping_cart')
 
+    @action(detail=False, methods=['post'], url_path='favorite',
+            url_name='favorite-bulk',
+            permission_classes=[permissions.IsAuthenticated])
+    def favorite_bulk_post(self, request):
+        return self.change_lists(request, Favourite, 'favorites_count',
+                                 bulk_add)
+
+    @favorite_bulk_post.mapping.delete
+    def favorite_bulk_delete(self, request):
+        return self.change_lists(request, Favourite, 'favorites_count',
+                                 bulk_remove)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart',
+            url_name='shopping-cart-bulk',
+            permission_classes=[permissions.IsAuthenticated])
+    def shopping_cart_bulk_post(self, request):
+        return self.change_lists(request, ShoppingCart,
+                                 'shopping_carts_count', bulk_add)
+
+    @shopping_cart_bulk_post.mapping.delete
+    def shopping_cart_bulk_delete(self, request):
+        return self.change_lists(request, ShoppingCart,
+                                 'shopping_carts_count', bulk_remove)
+
+    def change_lists(self, request, model, counter, operation):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Удаление отправляет сигнал на каждую строку корзины, их
+        # приращения применяются к списку покупок одним запросом.
+        with transaction.atomic(), batch_shopping_list_changes():
+            results = operation(
+                request.user, serializer.validated_data['ids'],
+                model, 'recipe_id', Recipe, counter)
+            if model is ShoppingCart and operation is bulk_add:
+                # Пакетная вставка сигналов не отправляет.
+                servings = ShoppingCart._meta.get_field(
+                    'servings').get_default()
+                carts_changed([
+                    (request.user.pk, result['id'], servings)
+                    for result in results if result['status'] == ADDED
+                ])
+        invalidate_recipe_state(request.user.pk)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
     def add_item_to_list(self, user, pk, list_type):
         try:
             if list_type == 'favorite':
@@ -62,7 +180,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     favourite_item).data
             elif list_type == 'shopping_cart':
                 serializer = ShoppingCartSerializer(
-                    data={}, context={'request': self.request, 'id': pk})
+                    data=self.request.data,
+                    context={'request': self.request, 'id': pk})
                 serializer.is_valid(raise_exception=True)
                 shopping_cart_item = serializer.create(
                     serializer.validated_data)
@@ -90,62 +209,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 {'errors': str(e)}, status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['get'], url_path='match')
+    def match(self, request):
+        query = RecipeMatchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        matches = recipe_match_index.match(
+            query.validated_data['ingredients'],
+            query.validated_data['limit'],
+            query.validated_data.get('max_missing'),
+        )
+        recipes = Recipe.objects.only(*RECIPE_FIELDS).in_bulk(
+            [recipe_id for recipe_id, _, _ in matches])
+        result = []
+        for recipe_id, matched, missing in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched = matched
+            recipe.missing = missing
+            result.append(recipe)
+        return Response(RecipeMatchSerializer(
+            result, many=True, context={'request': request}).data)
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, *args, **kwargs):
         recipe = self.get_object()
         short_link = recipe.short_link
         return Response({'short-link': short_link}, status=status.HTTP_200_OK)
 
+    @action(
+        detail=False, methods=['get'],
+        url_path='shopping_list',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def shopping_list(self, request):
+        items = request.user.shopping_list.select_related(
+            'ingredient').order_by('ingredient__name', 'id')
+        page = self.paginate_queryset(items)
+        serializer = ShoppingListItemSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False, methods=['get'],
         url_path='download_shopping_cart',
-        permission_classes=[permissions.IsAuthenticated]
+        permission_classes=[permissions.IsAuthenticated],
+        content_negotiation_class=ExportContentNegotiation,
     )
     def download_shopping_cart(self, request):
-        ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__shopping_carts__user=request.user)
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
-        )
-
-        if not ingredients.exists():
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in SHOPPING_CART_FORMATS:
             return Response(
-                {'errors': 'Корзина пуста.'},
+                {'errors': 'Неподдерживаемый формат выгрузки. Доступны: '
+                           + ', '.join(SHOPPING_CART_FORMATS)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        shopping_list_text = 'Список покупок:\n\n'
-        for item in ingredients:
-            shopping_list_text += (
-                f'{item["ingredient__name"]}, '
-                f'({item["ingredient__measurement_unit"]}) — '
-                f'{item["total_amount"]}\n'
+        shopping_list = request.user.shopping_list.all()
+        # Количества меняются на месте, поэтому ETag строится по
+        # содержимому строк, а не по их числу и максимальному id.
+        rows = shopping_list.values_list(
+            'ingredient_id', 'amount').order_by('ingredient_id')
+        digest = md5(export_format.encode(), usedforsecurity=False)
+        for ingredient_id, amount in rows:
+            digest.update(f':{ingredient_id}={amount}'.encode())
+        if not rows:
+            return Response(
+                {'errors': 'Корзина пуста.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        response = HttpResponse(shopping_list_text, content_type='text/plain')
-        response[
-            'Content-Disposition'] = 'attachment; filename="shopping_cart.txt"'
+        etag = quote_etag(digest.hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
 
+        ingredients = shopping_list.values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount',
+        ).order_by('ingredient__name', 'ingredient__measurement_unit')
+        content_type, render = SHOPPING_CART_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            render(normalize_shopping_list(ingredients.iterator())),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOPPING_CART_FILENAME}.{export_format}"'
+        )
+        response['ETag'] = etag
         return response
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
 
+    @action(detail=False, methods=['get'], url_path='autocomplete')
+    def autocomplete(self, request):
+        try:
+            limit = min(
+                int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT)),
+                AUTOCOMPLETE_MAX_LIMIT,
+            )
+        except ValueError:
+            limit = AUTOCOMPLETE_LIMIT
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), max(limit, 1)))
+
+
+class ProfilingView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(profile_store.report())
+
+    def delete(self, request):
+        profile_store.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class RecipeRedirectView(APIView):
-    def get(self, request, pk, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        full_link = recipe.full_link
-        return redirect(full_link)
+    """Переход по короткой ссылке /s/<код>/ или старой /r/<id>/."""
+
+    def get(self, request, pk=None, code=None, *args, **kwargs):
+        if code is not None:
+            try:
+                pk = decode_base62(code)
+            except ValueError:
+                raise Http404
+        if not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        return redirect(get_full_link(pk))
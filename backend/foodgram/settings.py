@@ -33,6 +33,9 @@ DEBUG = env.bool('DEBUG', False)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['127.0.0.1'])
 
+SITE_URL = env.str(
+    'SITE_URL', 'https://foodgrambyplahosha.ddns.net').rstrip('/')
+
 CSRF_TRUSTED_ORIGINS = [
     'https://foodgrambyplahosha.ddns.net',
     'https://www.foodgrambyplahosha.ddns.net',
@@ -46,6 +49,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
@@ -56,7 +60,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +71,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', False)
+PROFILING_SERVER_TIMING = env.bool('PROFILING_SERVER_TIMING', True)
+PROFILING_SAMPLE_SIZE = env.int('PROFILING_SAMPLE_SIZE', 1000)
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -98,10 +108,38 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'кака'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', 60),
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', True),
     }
 }
 
+# Реплики только для чтения: DB_REPLICA_HOSTS=replica1,replica2:5433.
+# Остальные параметры подключения берутся из основной базы.
+for number, replica in enumerate(env.list('DB_REPLICA_HOSTS', []), start=1):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = env.int('DB_REPLICA_STICKY_SECONDS', 10)
+REPLICA_PATH_PREFIXES = ('/api/',)
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+RECIPES_CACHE_TIMEOUT = env.int('RECIPES_CACHE_TIMEOUT', 5 * 60)
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -144,6 +182,13 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+IMAGE_VARIANTS_ASYNC = env.bool('IMAGE_VARIANTS_ASYNC', True)
+IMAGE_WORKERS = env.int('IMAGE_WORKERS', 2)
+IMAGE_THUMBNAIL_SIZE = (480, 480)
+IMAGE_WEBP_QUALITY = 80
+UPLOAD_MAX_SIZE = env.int('UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+UPLOAD_MAX_PIXELS = env.int('UPLOAD_MAX_PIXELS', 25_000_000)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
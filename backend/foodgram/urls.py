@@ -8,6 +8,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('r/<int:pk>/', RecipeRedirectView.as_view(), name='redirect'),
+    path('s/<str:code>/', RecipeRedirectView.as_view(), name='short-link'),
     path(
         'redoc/',
         TemplateView.as_view(template_name='redoc.html'),
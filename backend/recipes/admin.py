@@ -15,7 +15,8 @@ class TagInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'get_ingredients', 'get_tags')
+    list_display = ('name', 'author', 'favorites_count', 'get_ingredients',
+                    'get_tags')
     search_fields = ('author__username', 'name',)
     list_filter = ('tags',)
     empty_value_display = '---'
@@ -66,7 +67,7 @@ class FavouriteAdmin(admin.ModelAdmin):
 
 
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe',)
+    list_display = ('user', 'recipe', 'servings',)
     search_fields = ('user__username', 'recipe__name',)
     empty_value_display = '---'
 
@@ -0,0 +1,102 @@
+import threading
+from bisect import bisect_left
+from time import monotonic
+
+from django.db.models import Count, Max
+
+from recipes.constants import AUTOCOMPLETE_CHECK_INTERVAL
+from recipes.models import Ingredient
+
+
+class RefreshableIndex:
+    """Структура в памяти процесса, которая перестраивается из БД.
+
+    Подклассы задают _current_fingerprint - дешевый агрегат, по которому
+    видно, что данные изменились, и _build - полное построение индекса.
+    Отпечаток проверяется не чаще раза в check_interval секунд, а reset()
+    заставляет проверить и перестроить индекс при следующем обращении.
+    """
+
+    def __init__(self, check_interval):
+        self._lock = threading.Lock()
+        self._check_interval = check_interval
+        self._fingerprint = None
+        self._checked_at = None
+
+    def reset(self):
+        self._fingerprint = None
+        self._checked_at = None
+
+    def _current_fingerprint(self):
+        raise NotImplementedError
+
+    def _build(self, fingerprint):
+        raise NotImplementedError
+
+    def _ensure_fresh(self):
+        now = monotonic()
+        if (self._checked_at is not None
+                and now - self._checked_at < self._check_interval):
+            return
+        with self._lock:
+            fingerprint = self._current_fingerprint()
+            if fingerprint != self._fingerprint:
+                self._build(fingerprint)
+            self._checked_at = now
+
+
+class IngredientIndex(RefreshableIndex):
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся в отсортированном массиве, поэтому поиск по префиксу
+    сводится к бинарному поиску. Индекс перестраивается, если изменился
+    каталог: при сигналах модели, после импорта и по периодической
+    проверке количества и максимального id ингредиентов.
+    """
+
+    def __init__(self):
+        super().__init__(AUTOCOMPLETE_CHECK_INTERVAL)
+        self._data = ([], [])
+
+    def _current_fingerprint(self):
+        return tuple(Ingredient.objects.aggregate(
+            count=Count('id'), last=Max('id')).values())
+
+    def _build(self, fingerprint):
+        rows = sorted(
+            (name.lower(), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator()
+        )
+        self._data = (
+            [row[0] for row in rows],
+            [
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for _, pk, name, unit in rows
+            ],
+        )
+        self._fingerprint = fingerprint
+
+    def search(self, query, limit):
+        """Сначала совпадения по префиксу, затем по подстроке."""
+        self._ensure_fresh()
+        keys, items = self._data
+        query = query.strip().lower()
+        if not query:
+            return items[:limit]
+        start = bisect_left(keys, query)
+        end = start
+        while (end < len(keys) and end - start < limit
+               and keys[end].startswith(query)):
+            end += 1
+        result = items[start:end]
+        if len(result) < limit:
+            for position, key in enumerate(keys):
+                if query in key and not key.startswith(query):
+                    result.append(items[position])
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,74 @@
+from hashlib import md5
+from time import time, time_ns
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+
+from recipes.constants import RECIPE_STATE_CACHE_TIMEOUT
+
+RECIPE_STATE_KEY = 'recipe_state:{}'
+RECIPES_VERSION_KEY = 'recipes_version'
+RECIPES_MODIFIED_KEY = 'recipes_modified'
+RECIPES_RESPONSE_KEY = 'recipes:{}:{}:{}:{}'
+
+
+def get_recipe_state(user):
+    """Множества id рецептов в избранном и в корзине пользователя."""
+    key = RECIPE_STATE_KEY.format(user.pk)
+    state = cache.get(key)
+    if state is None:
+        state = (
+            frozenset(user.favorites.values_list('recipe_id', flat=True)),
+            frozenset(
+                user.shopping_carts.values_list('recipe_id', flat=True)),
+        )
+        cache.set(key, state, RECIPE_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def invalidate_recipe_state(user_id):
+    cache.delete(RECIPE_STATE_KEY.format(user_id))
+
+
+def get_recipes_version():
+    """Версия кэша ответов с рецептами, меняется при каждой записи."""
+    version = cache.get(RECIPES_VERSION_KEY)
+    if version is None:
+        cache.add(RECIPES_MODIFIED_KEY, int(time()), None)
+        cache.add(RECIPES_VERSION_KEY, time_ns(), None)
+        version = cache.get(RECIPES_VERSION_KEY)
+    return version
+
+
+def get_recipes_modified():
+    """Время последней смены версии кэша (unix time) или None.
+
+    В отличие от MAX(updated_at) меняется и при удалении рецептов, и при
+    изменении тегов, ингредиентов, авторов и популярности.
+    """
+    return cache.get(RECIPES_MODIFIED_KEY)
+
+
+def bump_recipes_version():
+    # Last-Modified считается в секундах: время смены версии всегда растет,
+    # чтобы изменение в ту же секунду не давало 304 со старым ответом.
+    modified = cache.get(RECIPES_MODIFIED_KEY) or 0
+    cache.set(RECIPES_MODIFIED_KEY, max(int(time()), modified + 1), None)
+    try:
+        cache.incr(RECIPES_VERSION_KEY)
+    except ValueError:
+        cache.set(RECIPES_VERSION_KEY, time_ns(), None)
+
+
+def get_recipes_response_key(request, action, pk=None):
+    params = urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    ))
+    digest = md5(
+        f'{request.scheme}://{request.get_host()}?{params}'.encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return RECIPES_RESPONSE_KEY.format(
+        get_recipes_version(), action, pk, digest)
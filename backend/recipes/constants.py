@@ -5,3 +5,18 @@ RECIPE_NAME_LENGTH = 256
 SHORT_LINK_LENGTH = 10
 MIN = 1
 MAX = 1000
+RECIPE_STATE_CACHE_TIMEOUT = 60 * 60
+AUTOCOMPLETE_CHECK_INTERVAL = 60
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_FAVORITE_WEIGHT = 1.0
+POPULARITY_CART_WEIGHT = 0.5
+SEARCH_CONFIG = 'russian'
+MATCH_CHECK_INTERVAL = 60
+MATCH_LIMIT = 20
+MATCH_MAX_LIMIT = 100
+MATCH_MAX_INGREDIENTS = 50
+BULK_MAX_ITEMS = 100
+MIN_SERVINGS = 1
+MAX_SERVINGS = 100
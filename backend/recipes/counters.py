@@ -0,0 +1,55 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favourite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favourite, 'recipe'),
+    (Recipe, 'shopping_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'subscribing'),
+)
+
+
+def increment_many(model, pks, field, delta=1):
+    """Атомарно изменяет денормализованный счетчик на delta."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: F(field) + delta})
+
+
+def decrement_many(model, pks, field, delta=1):
+    """Уменьшает счетчик, не опуская его ниже нуля при расхождении."""
+    if pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: Greatest(F(field) - delta, 0)})
+
+
+def increment(model, pk, field, delta=1):
+    increment_many(model, [pk], field, delta)
+
+
+def decrement(model, pk, field, delta=1):
+    decrement_many(model, [pk], field, delta)
+
+
+def recount():
+    """Пересчитывает все счетчики по исходным таблицам.
+
+    Возвращает количество исправленных строк для каждого счетчика.
+    """
+    fixed = {}
+    for model, field, source, relation in COUNTERS:
+        actual = Coalesce(Subquery(
+            source.objects.filter(**{relation: OuterRef('pk')})
+            .order_by().values(relation)
+            .annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ), 0)
+        fixed[f'{model._meta.model_name}.{field}'] = (
+            model.objects.annotate(actual=actual)
+            .exclude(**{field: F('actual')})
+            .update(**{field: actual})
+        )
+    return fixed
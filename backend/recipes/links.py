@@ -0,0 +1,35 @@
+from string import ascii_letters, digits
+
+from django.conf import settings
+
+from recipes.constants import SHORT_LINK_LENGTH
+
+BASE62_ALPHABET = digits + ascii_letters
+BASE62_INDEX = {char: index for index, char in enumerate(BASE62_ALPHABET)}
+
+
+def encode_base62(number):
+    """Короткий код рецепта: id в системе счисления по основанию 62."""
+    code = []
+    while True:
+        number, remainder = divmod(number, 62)
+        code.append(BASE62_ALPHABET[remainder])
+        if not number:
+            return ''.join(reversed(code))
+
+
+def decode_base62(code):
+    """Обратное преобразование; для некорректного кода - ValueError."""
+    if not 0 < len(code) <= SHORT_LINK_LENGTH:
+        raise ValueError('Недопустимая длина кода.')
+    number = 0
+    for char in code:
+        try:
+            number = number * 62 + BASE62_INDEX[char]
+        except KeyError:
+            raise ValueError(f'Недопустимый символ: {char}.') from None
+    return number
+
+
+def get_full_link(pk):
+    return f'{settings.SITE_URL}/recipes/{pk}/'
@@ -0,0 +1,148 @@
+from functools import partial
+
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from recipes.cache import invalidate_recipe_state
+from recipes.counters import decrement, increment
+from recipes.models import Recipe, ShoppingCart
+from recipes.shopping_list import carts_changed
+
+RECIPE_FIELDS = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+# Поля строки списка, которые нужны после ее удаления.
+REMOVED_FIELDS = {ShoppingCart: ('servings',)}
+
+ADD_SQL = """
+WITH inserted AS (
+    INSERT INTO {table} (user_id, recipe_id, created_at{columns})
+    SELECT %s, id, %s{values} FROM {recipes} WHERE id = %s
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+)
+UPDATE {recipes} SET {counter} = {counter} + 1
+FROM inserted WHERE {recipes}.id = inserted.recipe_id
+RETURNING {recipe_columns}
+"""
+
+REMOVE_SQL = """
+WITH deleted AS (
+    DELETE FROM {table} WHERE user_id = %s AND recipe_id = %s
+    RETURNING recipe_id{columns}
+)
+UPDATE {recipes} SET {counter} = GREATEST({counter} - 1, 0)
+FROM deleted WHERE {recipes}.id = deleted.recipe_id
+RETURNING deleted.recipe_id{deleted_columns}
+"""
+
+
+def _get_connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def _format(sql, connection, model, counter, fields=()):
+    quote = connection.ops.quote_name
+    recipes = quote(Recipe._meta.db_table)
+    return sql.format(
+        table=quote(model._meta.db_table),
+        recipes=recipes,
+        counter=quote(counter),
+        columns=''.join(f', {quote(field)}' for field in fields),
+        values=', %s' * len(fields),
+        deleted_columns=''.join(f', deleted.{quote(field)}'
+                                for field in fields),
+        recipe_columns=', '.join(f'{recipes}.{quote(field)}'
+                                 for field in RECIPE_FIELDS),
+    )
+
+
+def add_to_list(model, counter, user, recipe_id, **fields):
+    """Добавляет рецепт в избранное или корзину пользователя.
+
+    В PostgreSQL вставка, проверка дубликата по ограничению уникальности
+    и увеличение счетчика выполняются одним запросом. fields - значения
+    остальных полей строки списка, например множитель порций корзины.
+    Возвращает рецепт или None, если он уже был в списке. Если рецепта
+    нет - DoesNotExist.
+    """
+    connection = _get_connection(model)
+    if connection.vendor != 'postgresql':
+        recipe = Recipe.objects.only(*RECIPE_FIELDS).get(pk=recipe_id)
+        try:
+            with transaction.atomic(using=connection.alias):
+                model.objects.create(user=user, recipe=recipe, **fields)
+                increment(Recipe, recipe.pk, counter)
+        except IntegrityError:
+            return None
+        return recipe
+    # Сырой INSERT не знает значений по умолчанию из моделей Django.
+    fields = {
+        **{field.attname: field.get_default()
+           for field in model._meta.concrete_fields
+           if field.has_default() and not field.primary_key},
+        **fields,
+    }
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _format(ADD_SQL, connection, model, counter, fields),
+                [user.pk, timezone.now(), *fields.values(), recipe_id],
+            )
+            row = cursor.fetchone()
+        if row is not None and model is ShoppingCart:
+            carts_changed([(user.pk, recipe_id, fields['servings'])])
+    if row is None:
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Recipe.DoesNotExist
+        return None
+    transaction.on_commit(partial(invalidate_recipe_state, user.pk))
+    return Recipe(**dict(zip(RECIPE_FIELDS, row)))
+
+
+def remove_from_list(model, counter, user, recipe_id):
+    """Удаляет рецепт из списка пользователя одним DELETE.
+
+    Возвращает True, если строка была удалена. Если рецепта нет -
+    DoesNotExist.
+    """
+    connection = _get_connection(model)
+    if connection.vendor != 'postgresql':
+        with transaction.atomic(using=connection.alias):
+            deleted, _ = model.objects.filter(
+                user=user, recipe_id=recipe_id).delete()
+            if deleted:
+                decrement(Recipe, recipe_id, counter)
+    else:
+        fields = REMOVED_FIELDS.get(model, ())
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    _format(REMOVE_SQL, connection, model, counter, fields),
+                    [user.pk, recipe_id],
+                )
+                row = cursor.fetchone()
+            deleted = row is not None
+            if deleted and model is ShoppingCart:
+                carts_changed([(user.pk, recipe_id, -row[1])])
+        if deleted:
+            transaction.on_commit(partial(invalidate_recipe_state, user.pk))
+    if not deleted and not Recipe.objects.filter(pk=recipe_id).exists():
+        raise Recipe.DoesNotExist
+    return bool(deleted)
+
+
+def set_servings(user, recipe_id, servings):
+    """Меняет множитель порций рецепта в корзине.
+
+    Строка корзины блокируется, чтобы список покупок получил разницу
+    именно с тем множителем, который был заменен. Возвращает True, если
+    рецепт был в корзине. Если рецепта нет - DoesNotExist.
+    """
+    with transaction.atomic():
+        cart = ShoppingCart.objects.select_for_update().filter(
+            user=user, recipe_id=recipe_id).only('servings').first()
+        if cart is not None:
+            ShoppingCart.objects.filter(pk=cart.pk).update(servings=servings)
+            carts_changed([(user.pk, recipe_id, servings - cart.servings)])
+    if cart is None and not Recipe.objects.filter(pk=recipe_id).exists():
+        raise Recipe.DoesNotExist
+    return cart is not None
@@ -0,0 +1,50 @@
+import csv
+import json
+import os
+
+from django.core.management.base import CommandError
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """Построчно читает объекты из JSON-массива, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив объектов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(JSON_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON поврежден или обрезан.')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_rows(file_path, fields):
+    """Пары значений из CSV (по позиции) или JSON (по ключам fields)."""
+    if not os.path.exists(file_path):
+        raise CommandError(f'Файл {file_path} не найден.')
+    with open(file_path, mode='r', encoding='utf-8') as file:
+        if file_path.endswith('.json'):
+            rows = (
+                tuple(item.get(field, '') for field in fields)
+                for item in iter_json_array(file)
+            )
+        else:
+            rows = csv.reader(file)
+        for row in rows:
+            if len(row) < len(fields):
+                continue
+            values = tuple(str(value).strip() for value in row[:len(fields)])
+            if all(values):
+                yield values
@@ -0,0 +1,153 @@
+import json
+from contextlib import ExitStack
+from math import ceil
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Tag
+from users.models import User
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку и число запросов к БД у основных эндпоинтов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument(
+            '--user', help='Email пользователя для авторизованных запросов.')
+        parser.add_argument(
+            '--baseline', help='JSON с прошлыми результатами для сравнения.')
+        parser.add_argument(
+            '--save', help='Куда сохранить результаты в формате JSON.')
+        parser.add_argument(
+            '--threshold', type=float, default=20.0,
+            help='Допустимый рост p95 в процентах относительно baseline.')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        results = {
+            name: self.measure(client, url, options['iterations'])
+            for name, client, url in self.get_scenarios(user)
+        }
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['threshold'])
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                cart=Count('shopping_carts')).order_by('-cart').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей: сначала выполните generate_data.')
+        return user
+
+    def get_client(self, user=None):
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS
+             if host != '*' and not host.startswith('.')),
+            'localhost',
+        )
+        client = APIClient(HTTP_HOST=host)
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    def get_scenarios(self, user):
+        anonymous = self.get_client()
+        authorized = self.get_client(user)
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        prefix = ingredient.name[:2] if ingredient else ''
+        return (
+            ('recipes', anonymous, '/api/recipes/'),
+            ('recipes_auth', authorized, '/api/recipes/'),
+            ('recipes_by_tag', authorized,
+             f'/api/recipes/?tags={tag.slug if tag else ""}'),
+            ('recipes_by_author', authorized,
+             f'/api/recipes/?author={user.pk}'),
+            ('recipes_popular', anonymous, '/api/recipes/?ordering=popular'),
+            ('recipes_favorited', authorized,
+             '/api/recipes/?is_favorited=1'),
+            ('subscriptions', authorized, '/api/users/subscriptions/'),
+            ('ingredients', anonymous, f'/api/ingredients/?name={prefix}'),
+            ('download_shopping_cart', authorized,
+             '/api/recipes/download_shopping_cart/'),
+        )
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.status_code >= 500:
+            raise CommandError(f'{url}: ответ {response.status_code}.')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, client, url, iterations):
+        self.request(client, url)
+        timings = []
+        queries = 0
+        for _ in range(iterations):
+            # Чтения могут уйти в реплики, поэтому запросы собираются со
+            # всех подключений, а не только с основной базы.
+            with ExitStack() as stack:
+                contexts = [
+                    stack.enter_context(
+                        CaptureQueriesContext(connections[alias]))
+                    for alias in connections
+                ]
+                started = perf_counter()
+                self.request(client, url)
+                timings.append((perf_counter() - started) * 1000)
+            queries = max(queries, sum(map(len, contexts)))
+        return {
+            'url': url,
+            'throughput': round(len(timings) / (sum(timings) / 1000), 2),
+            'p50': round(percentile(timings, 50), 2),
+            'p95': round(percentile(timings, 95), 2),
+            'queries': queries,
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"сценарий":<24}{"rps":>10}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"SQL":>6}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<24}{result["throughput"]:>10}{result["p50"]:>10}'
+                f'{result["p95"]:>10}{result["queries"]:>6}')
+
+    def compare(self, results, baseline_path, threshold):
+        with open(baseline_path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            change = (result['p95'] / previous['p95'] - 1) * 100
+            self.stdout.write(
+                f'{name}: p95 {previous["p95"]} -> {result["p95"]} мс '
+                f'({change:+.1f}%), SQL {previous["queries"]} -> '
+                f'{result["queries"]}')
+            if change > threshold or result['queries'] > previous['queries']:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(
+                'Регрессия производительности: ' + ', '.join(regressions))
@@ -0,0 +1,151 @@
+import random
+from itertools import islice
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from recipes.counters import recount
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.search import update_search_vector
+from recipes.shopping_list import refresh_shopping_lists
+from users.models import Subscription, User
+
+BATCH_SIZE = 2000
+PASSWORD = 'synthetic-password'
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Рецептов в избранном у пользователя.')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Рецептов в корзине у пользователя.')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок у пользователя.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги: '
+                'import_ingredients и import_tags.')
+
+        started = perf_counter()
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            recipe_ids = self.create_recipes(
+                user_ids, options['recipes'], ingredient_ids, tag_ids,
+                options['ingredients_per_recipe'], options['tags_per_recipe'],
+            )
+            self.create_pairs(
+                Favourite, 'recipe_id', user_ids, recipe_ids,
+                options['favorites'])
+            self.create_pairs(
+                ShoppingCart, 'recipe_id', user_ids, recipe_ids,
+                options['carts'])
+            self.create_pairs(
+                Subscription, 'subscribing_id', user_ids, user_ids,
+                options['subscriptions'], exclude_self=True)
+            # bulk_create не обновляет денормализованные счетчики.
+            recount()
+            refresh_shopping_lists(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}, '
+            f'время: {perf_counter() - started:.2f} с.'
+        ))
+
+    def create_users(self, count):
+        offset = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        password = make_password(PASSWORD)
+        users = (
+            User(
+                email=f'synthetic{number}@example.com',
+                username=f'synthetic{number}',
+                first_name='Синтетический',
+                last_name=f'Пользователь {number}',
+                password=password,
+            )
+            for number in range(offset, offset + count)
+        )
+        return [
+            user.pk
+            for batch in batched(users, self.batch_size)
+            for user in User.objects.bulk_create(batch)
+        ]
+
+    def create_recipes(self, user_ids, count, ingredient_ids, tag_ids,
+                       ingredients_per_recipe, tags_per_recipe):
+        recipe_ids = []
+        ingredients_per_recipe = min(
+            ingredients_per_recipe, len(ingredient_ids))
+        tags_per_recipe = min(tags_per_recipe, len(tag_ids))
+        for numbers in batched(range(count), self.batch_size):
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=self.random.choice(user_ids),
+                    name=f'Синтетический рецепт {number}',
+                    text='Описание синтетического рецепта.',
+                    cooking_time=self.random.randint(1, 180),
+                    image='recipes/images/temp.png',
+                )
+                for number in numbers
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient_id in self.random.sample(
+                    ingredient_ids, ingredients_per_recipe)
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in self.random.sample(tag_ids, tags_per_recipe)
+            )
+            update_search_vector(Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]))
+            recipe_ids.extend(recipe.pk for recipe in recipes)
+        return recipe_ids
+
+    def create_pairs(self, model, field, user_ids, target_ids, per_user,
+                     exclude_self=False):
+        sample_size = min(per_user + exclude_self, len(target_ids))
+        rows = (
+            model(user_id=user_id, **{field: target_id})
+            for user_id in user_ids
+            for target_id in [
+                target_id
+                for target_id in self.random.sample(target_ids, sample_size)
+                if not (exclude_self and target_id == user_id)
+            ][:per_user]
+        )
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from api.images import VARIANTS_FIELD, generate_variants, mark_variants_ready
+from recipes.cache import bump_recipes_version
+from recipes.models import Recipe
+from users.models import User
+
+IMAGE_FIELDS = ((Recipe, 'image'), (User, 'avatar'))
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии и WebP-версии загруженных изображений'
+
+    def handle(self, *args, **options):
+        created = 0
+        for model, field_name in IMAGE_FIELDS:
+            variants_field = VARIANTS_FIELD.format(field_name)
+            names = (
+                model.objects
+                .exclude(Q(**{field_name: ''})
+                         | Q(**{f'{field_name}__isnull': True}))
+                .exclude(**{variants_field: F(field_name)})
+                .order_by().values_list(field_name, flat=True).distinct()
+            )
+            storage = model._meta.get_field(field_name).storage
+            for name in names:
+                try:
+                    generate_variants(storage, name)
+                except (OSError, ValueError) as error:
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                mark_variants_ready(model, field_name, name)
+                created += 1
+        if created:
+            bump_recipes_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {created}.'))
@@ -1,26 +1,80 @@
-import csv
+from itertools import islice
+from time import perf_counter
 
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 
+from recipes.autocomplete import ingredient_index
+from recipes.management.commands._readers import iter_rows
 from recipes.models import Ingredient
 
+BATCH_SIZE = 5000
+
 
 class Command(BaseCommand):
-    help = 'Загружает файлы ingredients.csv в базу данных'
-
-    def handle(self, *args, **kwargs):
-        file_path = 'data/ingredients.csv'
-        with open(file_path, mode='r', encoding='utf-8') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                ingredient_name = row[0].strip()
-                measurement_unit = row[1].strip()
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=ingredient_name,
-                    measurement_unit=measurement_unit
+    help = 'Загружает ингредиенты из CSV или JSON в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file_path', nargs='?', default='data/ingredients.csv')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        file_path = options['file_path']
+        started = perf_counter()
+        count_before = Ingredient.objects.count()
+        if (not options['no_copy'] and file_path.endswith('.csv')
+                and connection.vendor == 'postgresql'):
+            processed = self.copy_rows(file_path)
+        else:
+            processed = self.insert_rows(file_path, options['batch_size'])
+        created = Ingredient.objects.count() - count_before
+        ingredient_index.reset()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, создано ингредиентов: {created}, '
+            f'пропущено: {processed - created}, '
+            f'время: {perf_counter() - started:.2f} с.'
+        ))
+
+    def insert_rows(self, file_path, batch_size):
+        processed = 0
+        rows = iter_rows(file_path, ('name', 'measurement_unit'))
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return processed
+            processed += len(batch)
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=unit)
+                    for name, unit in dict.fromkeys(batch)
+                ),
+                ignore_conflicts=True,
+            )
+
+    def copy_rows(self, file_path):
+        """Быстрая загрузка через COPY во временную таблицу PostgreSQL."""
+        table = Ingredient._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            with open(file_path, mode='r', encoding='utf-8') as file:
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    file,
                 )
-                if created:
-                    self.stdout.write(f'Создан ингридиент: {ingredient.name}.')
-                else:
-                    self.stdout.write(
-                        f'Ингредиент {ingredient.name} уже существует.')
+            cursor.execute('SELECT count(*) FROM ingredient_import')
+            processed = cursor.fetchone()[0]
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT trim(name), trim(measurement_unit) '
+                'FROM ingredient_import '
+                "WHERE trim(name) <> '' AND trim(measurement_unit) <> '' "
+                'ON CONFLICT DO NOTHING'
+            )
+        return processed
@@ -1,26 +1,27 @@
-import csv
+from time import perf_counter
 
 from django.core.management.base import BaseCommand
 
+from recipes.management.commands._readers import iter_rows
 from recipes.models import Tag
 
 
 class Command(BaseCommand):
-    help = 'Загружает файлы tags.csv в базу данных'
+    help = 'Загружает теги из CSV или JSON в базу данных'
 
-    def handle(self, *args, **kwargs):
-        file_path = 'data/tags.csv'
-        with open(file_path, mode='r', encoding='utf-8') as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for row in csv_reader:
-                tag_name = row[0].strip()
-                tag_slug = row[1].strip()
-                tag, created = Tag.objects.get_or_create(
-                    name=tag_name,
-                    slug=tag_slug
-                )
-                if created:
-                    self.stdout.write(f'Создан тег: {tag.name}.')
-                else:
-                    self.stdout.write(
-                        f'Тег {tag.name} уже существует.')
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', nargs='?', default='data/tags.csv')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        rows = dict(iter_rows(options['file_path'], ('name', 'slug')))
+        count_before = Tag.objects.count()
+        Tag.objects.bulk_create(
+            (Tag(name=name, slug=slug) for name, slug in rows.items()),
+            ignore_conflicts=True,
+        )
+        created = Tag.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано тегов: {len(rows)}, создано: {created}, '
+            f'время: {perf_counter() - started:.2f} с.'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+from recipes.models import ShoppingCart, ShoppingListItem
+from recipes.shopping_list import refresh_shopping_lists
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики избранного и подписок '
+            'и списки покупок')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = recount()
+        for counter, rows in fixed.items():
+            self.stdout.write(f'{counter}: исправлено строк {rows}.')
+        user_ids = set(
+            ShoppingCart.objects.values_list('user_id', flat=True)
+        ) | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+        refresh_shopping_lists(user_ids)
+        self.stdout.write(f'Списков покупок пересобрано: {len(user_ids)}.')
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
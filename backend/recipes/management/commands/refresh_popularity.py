@@ -0,0 +1,22 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from recipes.popularity import refresh_popularity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает популярность рецептов для ?ordering=popular'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты, а не только измененные.')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        count = refresh_popularity(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {count}, '
+            f'время: {perf_counter() - started:.2f} с.'
+        ))
@@ -0,0 +1,70 @@
+from array import array
+from collections import Counter
+from heapq import nsmallest
+
+from django.db.models import Count, Max
+
+from recipes.autocomplete import RefreshableIndex
+from recipes.constants import MATCH_CHECK_INTERVAL
+from recipes.models import RecipeIngredient
+
+
+class RecipeMatchIndex(RefreshableIndex):
+    """Обратный индекс ингредиент -> рецепты для подбора по продуктам.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    а для каждого рецепта - общее число его ингредиентов. Подбор
+    проходит только по спискам выбранных ингредиентов, не обращаясь к БД.
+    """
+
+    def __init__(self):
+        super().__init__(MATCH_CHECK_INTERVAL)
+        self._data = ({}, {})
+
+    def _current_fingerprint(self):
+        return tuple(RecipeIngredient.objects.aggregate(
+            count=Count('id'), last=Max('id')).values())
+
+    def _build(self, fingerprint):
+        postings = {}
+        sizes = Counter()
+        rows = RecipeIngredient.objects.values_list(
+            'ingredient_id', 'recipe_id').order_by(
+                'ingredient_id', 'recipe_id').iterator()
+        for ingredient_id, recipe_id in rows:
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array('l')
+            postings[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        self._data = (postings, dict(sizes))
+        self._fingerprint = fingerprint
+
+    def match(self, ingredient_ids, limit, max_missing=None):
+        """Рецепты с наибольшим покрытием выбранными ингредиентами.
+
+        Возвращает список (recipe_id, matched, missing): сначала рецепты,
+        для которых не хватает меньше всего ингредиентов, при равенстве -
+        с большим числом совпадений, затем более новые.
+        """
+        self._ensure_fresh()
+        postings, sizes = self._data
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        candidates = (
+            (recipe_id, count, sizes[recipe_id] - count)
+            for recipe_id, count in matched.items()
+        )
+        if max_missing is not None:
+            candidates = (
+                candidate for candidate in candidates
+                if candidate[2] <= max_missing
+            )
+        return nsmallest(
+            limit, candidates,
+            key=lambda candidate: (candidate[2], -candidate[1],
+                                   -candidate[0]),
+        )
+
+
+recipe_match_index = RecipeMatchIndex()
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:02
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favourite', 'recipe'),
+    ('recipes.Recipe', 'shopping_carts_count', 'recipes.ShoppingCart',
+     'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'subscribers_count', 'users.Subscription', 'subscribing'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, source_name, relation in COUNTERS:
+        source = apps.get_model(source_name)
+        apps.get_model(model_name).objects.update(**{field: Coalesce(
+            Subquery(
+                source.objects.filter(**{relation: OuterRef('pk')})
+                .order_by().values(relation)
+                .annotate(total=Count('pk')).values('total'),
+                output_field=IntegerField(),
+            ),
+            0,
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_filter_indexes'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_search'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='full_link',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='short_link',
+        ),
+    ]
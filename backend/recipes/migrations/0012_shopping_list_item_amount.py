@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppinglistitem',
+            name='amount',
+            field=models.IntegerField(verbose_name='Количество'),
+        ),
+    ]
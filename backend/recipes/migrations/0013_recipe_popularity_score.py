@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:55
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Порядок 'popular' - popularity_score DESC NULLS LAST, id DESC. SQLite не
+# поддерживает NULLS LAST в индексах (и без него ставит NULL в конец при
+# DESC), поэтому индекс создается только в PostgreSQL.
+CREATE_SQL = (
+    'CREATE INDEX IF NOT EXISTS recipe_popular_idx ON recipes_recipe '
+    '(popularity_score DESC NULLS LAST, id DESC)',
+)
+DROP_SQL = (
+    'DROP INDEX IF EXISTS recipe_popular_idx',
+)
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+def fill_popularity_score(apps, schema_editor):
+    popularity = apps.get_model('recipes', 'RecipePopularity')
+    apps.get_model('recipes', 'Recipe').objects.update(
+        popularity_score=Subquery(
+            popularity.objects.filter(recipe=OuterRef('pk')).values('score')
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_shopping_list_item_amount'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recipepopularity',
+            name='recipe_popularity_idx',
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity_score',
+            field=models.FloatField(editable=False, null=True, verbose_name='Популярность'),
+        ),
+        migrations.RunPython(
+            fill_popularity_score, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SQL), run_on_postgresql(DROP_SQL)),
+    ]
@@ -1,9 +1,13 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.db.models import UniqueConstraint
 
-from recipes.constants import (INGR_NAME_LENGTH, INGR_UNIT_LENGTH, MAX, MIN,
+from recipes.constants import (INGR_NAME_LENGTH, INGR_UNIT_LENGTH, MAX,
+                               MAX_SERVINGS, MIN, MIN_SERVINGS,
                                RECIPE_NAME_LENGTH, TAG_LENGTH)
+from recipes.links import encode_base62, get_full_link
 from users.models import User
 
 
@@ -74,12 +78,14 @@ class RecipeTag(models.Model):
         on_delete=models.CASCADE,
         related_name='recipe_tags'
     )
+    # Индекс по tag дает recipe_tag_idx, отдельный индекс FK не нужен.
     tag = models.ForeignKey(
         Tag,
         blank=False,
         null=False,
         on_delete=models.CASCADE,
-        related_name='recipe_tags'
+        related_name='recipe_tags',
+        db_index=False,
     )
 
     class Meta:
@@ -90,6 +96,9 @@ class RecipeTag(models.Model):
             UniqueConstraint(fields=['recipe', 'tag'],
                              name='unique_recipe_tag')
         ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'], name='recipe_tag_idx'),
+        ]
 
 
 class Recipe(models.Model):
@@ -100,11 +109,16 @@ class Recipe(models.Model):
         null=True,
         default=None
     )
+    # Имя изображения, для которого готовы уменьшенная копия и WebP.
+    image_variants = models.CharField(
+        'Варианты изображения', max_length=100, blank=True, editable=False)
     text = models.TextField('Описание')
+    # Индекс по author дает recipe_author_idx, отдельный индекс FK не нужен.
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
         verbose_name='Автор',
         related_name='recipes',
+        db_index=False,
     )
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -127,26 +141,42 @@ class Recipe(models.Model):
             MaxValueValidator(MAX)
         ]
     )
-    short_link = models.URLField(unique=True, blank=True, null=True)
-    full_link = models.URLField(blank=True, null=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    shopping_carts_count = models.PositiveIntegerField(
+        'В корзинах', default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Копия RecipePopularity.score: сортировка 'popular' читает индекс
+    # recipe_popular_idx (score DESC NULLS LAST, id DESC) без соединения с
+    # таблицей популярности. Индекс создается миграцией только в
+    # PostgreSQL: SQLite не поддерживает NULLS LAST в индексах.
+    popularity_score = models.FloatField(
+        'Популярность', null=True, editable=False)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['author', '-id'], name='recipe_author_idx'),
+            models.Index(
+                fields=['cooking_time', '-id'], name='recipe_quick_idx'),
+        ]
+
+    @property
+    def short_code(self):
+        return encode_base62(self.pk)
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if not self.short_link:
-            self.short_link = (
-                f'https://foodgrambyplahosha.ddns.net/r/{self.pk}/'
-            )
-            self.save(update_fields=['short_link'])
-        if not self.full_link:
-            self.full_link = (
-                f'https://foodgrambyplahosha.ddns.net/recipes/{self.pk}/'
-            )
-            self.save(update_fields=['full_link'])
+    @property
+    def short_link(self):
+        return f'{settings.SITE_URL}/s/{self.short_code}/'
+
+    @property
+    def full_link(self):
+        return get_full_link(self.pk)
 
     def __str__(self):
         return self.name
@@ -163,6 +193,8 @@ class Favourite(models.Model):
         verbose_name='Рецепт',
         related_name='favorites',
     )
+    created_at = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
 
@@ -185,6 +217,15 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт',
         related_name='shopping_carts',
     )
+    servings = models.PositiveSmallIntegerField(
+        'Множитель порций', default=MIN_SERVINGS,
+        validators=[
+            MinValueValidator(MIN_SERVINGS),
+            MaxValueValidator(MAX_SERVINGS)
+        ]
+    )
+    created_at = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = 'Корзина покупок'
@@ -193,3 +234,57 @@ class ShoppingCart(models.Model):
             UniqueConstraint(fields=['user', 'recipe'],
                              name='unique_shop_user_recipe')
         ]
+
+
+class RecipePopularity(models.Model):
+    """Предрассчитанная популярность рецепта.
+
+    score - логарифм суммы весов добавлений в избранное и корзину, каждое
+    из которых растет в два раза за POPULARITY_HALF_LIFE_DAYS от
+    фиксированной даты. Поэтому порядок рецептов не меняется со временем
+    и пересчитывать нужно только рецепты с новыми событиями. Для
+    сортировки score копируется в Recipe.popularity_score.
+    """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='popularity',
+    )
+    score = models.FloatField('Популярность')
+    events = models.PositiveIntegerField('Событий учтено')
+    computed_at = models.DateTimeField('Дата расчета')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя.
+
+    Материализованная агрегация RecipeIngredient по рецептам корзины.
+    Изменения корзин и ингредиентов применяются к ней приращениями,
+    полностью она пересобирается только при сверке счетчиков.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='+',
+    )
+    # Без CHECK: PostgreSQL проверяет его у вставляемой строки еще до
+    # ON CONFLICT, а отрицательные приращения там допустимы.
+    amount = models.IntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Список покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            UniqueConstraint(fields=['user', 'ingredient'],
+                             name='unique_shopping_list_item')
+        ]
@@ -0,0 +1,108 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from recipes.cache import bump_recipes_version
+from recipes.constants import (POPULARITY_CART_WEIGHT,
+                               POPULARITY_FAVORITE_WEIGHT,
+                               POPULARITY_HALF_LIFE_DAYS)
+from recipes.models import Favourite, Recipe, RecipePopularity, ShoppingCart
+
+POPULARITY_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(days=POPULARITY_HALF_LIFE_DAYS)
+BATCH_SIZE = 1000
+EVENTS = (
+    (Favourite, POPULARITY_FAVORITE_WEIGHT),
+    (ShoppingCart, POPULARITY_CART_WEIGHT),
+)
+
+
+def calculate_score(events):
+    """Логарифм суммы weight * 2 ** ((t - epoch) / half_life).
+
+    Считается через максимум показателя, чтобы сумма не переполнялась.
+    """
+    exponents = [
+        (weight, (created_at - POPULARITY_EPOCH) / HALF_LIFE)
+        for weight, created_at in events
+    ]
+    top = max(exponent for _, exponent in exponents)
+    return top + math.log2(sum(
+        weight * 2 ** (exponent - top) for weight, exponent in exponents))
+
+
+def get_stale_recipe_ids(since):
+    """Рецепты, у которых изменился набор добавлений.
+
+    Новые добавления находятся по created_at, а удаления - по расхождению
+    числа учтенных событий с денормализованными счетчиками рецепта.
+    """
+    total = F('favorites_count') + F('shopping_carts_count')
+    stale = set(
+        Recipe.objects.annotate(total=total).filter(
+            Q(popularity__isnull=True, total__gt=0)
+            | Q(popularity__isnull=False)
+            & ~Q(popularity__events=F('total'))
+        ).values_list('id', flat=True)
+    )
+    for model, _ in EVENTS:
+        stale.update(model.objects.filter(created_at__gte=since)
+                     .values_list('recipe_id', flat=True))
+    return stale
+
+
+def recalculate(recipe_ids, computed_at):
+    events = defaultdict(list)
+    for model, weight in EVENTS:
+        for recipe_id, created_at in model.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'created_at'):
+            events[recipe_id].append((weight, created_at))
+    RecipePopularity.objects.filter(
+        recipe_id__in=set(recipe_ids) - events.keys()).delete()
+    RecipePopularity.objects.bulk_create(
+        [
+            RecipePopularity(
+                recipe_id=recipe_id,
+                score=calculate_score(recipe_events),
+                events=len(recipe_events),
+                computed_at=computed_at,
+            )
+            for recipe_id, recipe_events in events.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=['score', 'events', 'computed_at'],
+    )
+    # Рецепты без событий получают NULL и уходят в конец сортировки.
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        popularity_score=Subquery(RecipePopularity.objects.filter(
+            recipe=OuterRef('pk')).values('score')))
+
+
+def refresh_popularity(full=False):
+    """Пересчитывает популярность рецептов.
+
+    По умолчанию обрабатываются только рецепты с добавлениями или
+    удалениями после прошлого расчета. Возвращает число пересчитанных
+    рецептов.
+    """
+    started = timezone.now()
+    since = RecipePopularity.objects.aggregate(
+        last=Max('computed_at'))['last']
+    if full or since is None:
+        recipe_ids = set(Recipe.objects.values_list('id', flat=True))
+    else:
+        recipe_ids = get_stale_recipe_ids(since)
+    recipe_ids = sorted(recipe_ids)
+    with transaction.atomic():
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            recalculate(recipe_ids[start:start + BATCH_SIZE], started)
+        if recipe_ids:
+            transaction.on_commit(bump_recipes_version)
+    return len(recipe_ids)
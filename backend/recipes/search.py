@@ -0,0 +1,83 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections, router
+from django.db.models import Exists, F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from recipes.constants import SEARCH_CONFIG
+from recipes.models import Recipe, RecipeIngredient
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def weighted_vector(name, ingredient_names, text):
+    """Название весит больше ингредиентов, а ингредиенты - больше описания."""
+    return (
+        SearchVector(name, weight='A', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='B', config=SEARCH_CONFIG)
+        + SearchVector(text, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def build_search_vector(name, ingredient_names, text):
+    """search_vector из известных значений для того же INSERT или UPDATE.
+
+    Позволяет не перечитывать ингредиенты отдельным UPDATE при сохранении
+    рецепта через API. На других СУБД - None.
+    """
+    if connections[router.db_for_write(Recipe)].vendor != 'postgresql':
+        return None
+    return weighted_vector(*(
+        Value(value, output_field=TextField())
+        for value in (name, ' '.join(ingredient_names), text)
+    ))
+
+
+def update_search_vector(queryset):
+    """Пересчитывает search_vector у выбранных рецептов одним UPDATE.
+
+    На других СУБД поле не заполняется: поиск там идет через icontains.
+    """
+    if not is_postgresql(queryset):
+        return
+    ingredient_names = Subquery(
+        RecipeIngredient.objects.filter(recipe=OuterRef('pk'))
+        .order_by().values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names'),
+        output_field=TextField(),
+    )
+    queryset.update(search_vector=weighted_vector(
+        'name',
+        Coalesce(ingredient_names, Value(''), output_field=TextField()),
+        'text',
+    ))
+
+
+def search_recipes(queryset, text):
+    """Полнотекстовый поиск с ранжированием.
+
+    Рецепты с опечаткой в названии находятся по триграммам и идут после
+    точных совпадений. Без PostgreSQL поиск работает через icontains по
+    названию, описанию и ингредиентам.
+    """
+    text = text.strip()
+    if not text:
+        return queryset
+    if not is_postgresql(queryset):
+        return queryset.filter(
+            Q(name__icontains=text)
+            | Q(text__icontains=text)
+            | Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=text))
+        )
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), query),
+        similarity=TrigramSimilarity('name', text),
+    ).filter(
+        Q(search_vector=query) | Q(name__trigram_similar=text)
+    ).order_by('-rank', '-similarity', '-id')
@@ -0,0 +1,214 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections, router, transaction
+from django.db.models import F, Sum
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 500
+
+CART_DELTAS_SQL = """
+SELECT cart.user_id, item.ingredient_id, item.amount * cart.servings
+FROM cart_delta AS cart
+JOIN {recipe_ingredients} AS item ON item.recipe_id = cart.recipe_id
+"""
+
+INGREDIENT_DELTAS_SQL = """
+SELECT cart.user_id, item.ingredient_id, item.amount * cart.servings
+FROM ingredient_delta AS item
+JOIN {carts} AS cart ON cart.recipe_id = item.recipe_id
+"""
+
+UPSERT_SQL = """
+WITH {sources}
+INSERT INTO {items} AS shopping_list (user_id, ingredient_id, amount)
+SELECT user_id, ingredient_id, SUM(amount)
+FROM ({deltas}) AS delta (user_id, ingredient_id, amount)
+GROUP BY user_id, ingredient_id
+ORDER BY user_id, ingredient_id
+ON CONFLICT (user_id, ingredient_id)
+DO UPDATE SET amount = shopping_list.amount + EXCLUDED.amount
+RETURNING shopping_list.id, shopping_list.amount
+"""
+
+_pending = ContextVar('shopping_list_pending', default=None)
+
+
+def refresh_shopping_lists(user_ids):
+    """Пересобирает материализованные списки покупок пользователей.
+
+    Суммы считаются одним GROUP BY только по корзинам этих пользователей,
+    количество каждого рецепта умножается на его множитель порций.
+    Используется только для полной сверки (recount, generate_data):
+    обычные изменения корзин применяются приращениями.
+    """
+    user_ids = sorted(set(user_ids))
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        totals = (
+            RecipeIngredient.objects
+            .filter(recipe__shopping_carts__user__in=batch)
+            .values_list('recipe__shopping_carts__user', 'ingredient')
+            .annotate(total=Sum(
+                F('amount') * F('recipe__shopping_carts__servings')))
+            .order_by()
+        )
+        with transaction.atomic():
+            ShoppingListItem.objects.filter(user__in=batch).delete()
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=total,
+                )
+                for user_id, ingredient_id, total in totals
+            )
+
+
+def _values(rows):
+    return ', '.join(['(%s, %s, %s)'] * len(rows))
+
+
+def _apply_sql(connection, cart_rows, ingredient_rows):
+    quote = connection.ops.quote_name
+    sources, deltas, params = [], [], []
+    if cart_rows:
+        sources.append('cart_delta (user_id, recipe_id, servings) AS '
+                       f'(VALUES {_values(cart_rows)})')
+        deltas.append(CART_DELTAS_SQL.format(
+            recipe_ingredients=quote(RecipeIngredient._meta.db_table)))
+        params.extend(value for row in cart_rows for value in row)
+    if ingredient_rows:
+        sources.append('ingredient_delta (recipe_id, ingredient_id, amount) '
+                       f'AS (VALUES {_values(ingredient_rows)})')
+        deltas.append(INGREDIENT_DELTAS_SQL.format(
+            carts=quote(ShoppingCart._meta.db_table)))
+        params.extend(value for row in ingredient_rows for value in row)
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format(
+            sources=', '.join(sources),
+            items=quote(ShoppingListItem._meta.db_table),
+            deltas=' UNION ALL '.join(deltas),
+        ), params)
+        empty = [pk for pk, amount in cursor.fetchall() if amount <= 0]
+    if empty:
+        ShoppingListItem.objects.filter(pk__in=empty).delete()
+
+
+def _apply_orm(cart_rows, ingredient_rows):
+    totals = defaultdict(int)
+    if cart_rows:
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id, amount in (
+            RecipeIngredient.objects
+            .filter(recipe_id__in={row[1] for row in cart_rows})
+            .values_list('recipe_id', 'ingredient_id', 'amount')
+        ):
+            ingredients[recipe_id].append((ingredient_id, amount))
+        for user_id, recipe_id, servings in cart_rows:
+            for ingredient_id, amount in ingredients[recipe_id]:
+                totals[user_id, ingredient_id] += amount * servings
+    if ingredient_rows:
+        carts = defaultdict(list)
+        for user_id, recipe_id, servings in (
+            ShoppingCart.objects
+            .filter(recipe_id__in={row[0] for row in ingredient_rows})
+            .values_list('user_id', 'recipe_id', 'servings')
+        ):
+            carts[recipe_id].append((user_id, servings))
+        for recipe_id, ingredient_id, amount in ingredient_rows:
+            for user_id, servings in carts[recipe_id]:
+                totals[user_id, ingredient_id] += amount * servings
+    existing = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in={user_id for user_id, _ in totals},
+            ingredient_id__in={ingredient_id for _, ingredient_id in totals},
+        )
+    }
+    created, changed, empty = [], [], []
+    for (user_id, ingredient_id), amount in totals.items():
+        item = existing.get((user_id, ingredient_id))
+        if item is None:
+            if amount > 0:
+                created.append(ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=amount,
+                ))
+            continue
+        item.amount += amount
+        if item.amount > 0:
+            changed.append(item)
+        else:
+            empty.append(item.pk)
+    ShoppingListItem.objects.bulk_create(created)
+    ShoppingListItem.objects.bulk_update(changed, ['amount'])
+    if empty:
+        ShoppingListItem.objects.filter(pk__in=empty).delete()
+
+
+def apply_deltas(cart_rows=(), ingredient_rows=()):
+    """Применяет приращения к спискам покупок одним запросом.
+
+    cart_rows - (user_id, recipe_id, servings): рецепт добавлен в корзину
+    (или убран из нее с отрицательным множителем). ingredient_rows -
+    (recipe_id, ingredient_id, amount): у рецепта изменилось количество
+    ингредиента, приращение получают все корзины с этим рецептом.
+    В PostgreSQL это один INSERT ... ON CONFLICT DO UPDATE, поэтому
+    параллельные изменения одного списка не конфликтуют, а строки с
+    нулевым итогом удаляются отдельным DELETE.
+    """
+    cart_rows = [row for row in cart_rows if row[2]]
+    ingredient_rows = [row for row in ingredient_rows if row[2]]
+    if not cart_rows and not ingredient_rows:
+        return
+    connection = connections[router.db_for_write(ShoppingListItem)]
+    with transaction.atomic(using=connection.alias):
+        if connection.vendor == 'postgresql':
+            _apply_sql(connection, cart_rows, ingredient_rows)
+        else:
+            _apply_orm(cart_rows, ingredient_rows)
+
+
+@contextmanager
+def batch_shopping_list_changes():
+    """Копит приращения внутри блока и применяет их одним запросом.
+
+    В одном блоке должны меняться либо корзины, либо ингредиенты
+    рецептов: приращения считаются по состоянию БД на выходе из блока.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    pending = ([], [])
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    apply_deltas(*pending)
+
+
+def carts_changed(rows):
+    """Рецепты добавлены в корзины или убраны из них.
+
+    rows - (user_id, recipe_id, изменение множителя порций).
+    """
+    pending = _pending.get()
+    if pending is None:
+        apply_deltas(cart_rows=rows)
+    else:
+        pending[0].extend(rows)
+
+
+def recipe_ingredients_changed(rows):
+    """У рецептов изменились ингредиенты.
+
+    rows - (recipe_id, ingredient_id, изменение количества).
+    """
+    pending = _pending.get()
+    if pending is None:
+        apply_deltas(ingredient_rows=rows)
+    else:
+        pending[1].extend(rows)
@@ -0,0 +1,128 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes.autocomplete import ingredient_index
+from recipes.cache import bump_recipes_version, invalidate_recipe_state
+from recipes.matching import recipe_match_index
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.shopping_list import (apply_deltas, carts_changed,
+                                   recipe_ingredients_changed)
+from users.models import User
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_delete, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def reset_recipe_state(sender, instance, **kwargs):
+    # После фиксации: иначе параллельное чтение закэширует старые
+    # множества на RECIPE_STATE_CACHE_TIMEOUT.
+    transaction.on_commit(partial(invalidate_recipe_state, instance.user_id))
+
+
+def deleted_with(origin, *models):
+    """Удаление каскадное и начато с объекта одной из моделей."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_saved_row(sender, instance, **kwargs):
+    # Для приращения списка покупок при изменении существующей строки.
+    instance.saved_row = None
+    if not instance._state.adding:
+        instance.saved_row = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_cart_to_shopping_list(sender, instance, **kwargs):
+    rows = [(instance.user_id, instance.recipe_id, instance.servings)]
+    saved = getattr(instance, 'saved_row', None)
+    if saved is not None:
+        rows.append((saved.user_id, saved.recipe_id, -saved.servings))
+    carts_changed(rows)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_cart_from_shopping_list(sender, instance, origin=None, **kwargs):
+    # Списки удаленного пользователя удаляются каскадом, а удаленные
+    # рецепты вычитаются в remove_recipe_from_shopping_lists.
+    if deleted_with(origin, Recipe, User):
+        return
+    carts_changed([(instance.user_id, instance.recipe_id, -instance.servings)])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_ingredient_to_shopping_lists(sender, instance, **kwargs):
+    rows = [(instance.recipe_id, instance.ingredient_id, instance.amount)]
+    saved = getattr(instance, 'saved_row', None)
+    if saved is not None:
+        rows.append((saved.recipe_id, saved.ingredient_id, -saved.amount))
+    recipe_ingredients_changed(rows)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_ingredient_from_shopping_lists(sender, instance, origin=None,
+                                          **kwargs):
+    # Строки списков удаленного ингредиента удаляются каскадом.
+    if deleted_with(origin, Recipe, User, Ingredient):
+        return
+    recipe_ingredients_changed(
+        [(instance.recipe_id, instance.ingredient_id, -instance.amount)])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    # Пока корзины и ингредиенты рецепта на месте, из всех списков
+    # вычитается весь рецепт одним запросом.
+    apply_deltas(ingredient_rows=[
+        (recipe_id, ingredient_id, -amount)
+        for recipe_id, ingredient_id, amount in
+        instance.recipe_ingredients.values_list(
+            'recipe_id', 'ingredient_id', 'amount')
+    ])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reset_ingredient_index(sender, **kwargs):
+    ingredient_index.reset()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def reset_recipe_match_index(sender, **kwargs):
+    transaction.on_commit(recipe_match_index.reset)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeIngredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reset_recipes_cache(sender, **kwargs):
+    transaction.on_commit(bump_recipes_version)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def reset_recipes_cache_for_user(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(bump_recipes_version)
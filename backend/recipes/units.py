@@ -0,0 +1,56 @@
+from itertools import groupby
+from operator import itemgetter
+
+# Единица измерения -> (каноническая единица, множитель). Остальные
+# единицы (шт., ст. л., щепотка...) не пересчитываются и не сливаются.
+UNIT_CONVERSIONS = {
+    'мг': ('г', 0.001),
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+}
+
+# Каноническая единица -> (крупная единица, множитель), в которую
+# переводится сумма, когда она не меньше множителя.
+DISPLAY_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+
+CONVERSIONS = {
+    unit.strip().lower(): conversion
+    for unit, conversion in UNIT_CONVERSIONS.items()
+}
+
+
+def to_canonical(unit, amount):
+    canonical, factor = CONVERSIONS.get(unit.strip().lower(), (unit, 1))
+    return canonical, amount * factor
+
+
+def humanize(unit, amount):
+    """Переводит сумму в крупную единицу и убирает лишние знаки."""
+    display, factor = DISPLAY_UNITS.get(unit, (unit, 1))
+    if amount >= factor:
+        unit, amount = display, amount / factor
+    amount = round(amount, 3)
+    if amount == int(amount):
+        amount = int(amount)
+    return unit, amount
+
+
+def normalize_shopping_list(items):
+    """Сливает совместимые единицы одного продукта и округляет итог.
+
+    items - строки (название, единица, количество), отсортированные по
+    названию. Строки одного продукта идут подряд, поэтому суммирование
+    проходит по ним один раз и держит в памяти только текущий продукт.
+    """
+    for name, rows in groupby(items, key=itemgetter(0)):
+        totals = {}
+        for _, unit, amount in rows:
+            unit, amount = to_canonical(unit, amount)
+            totals[unit] = totals.get(unit, 0) + amount
+        for unit, amount in totals.items():
+            yield (name, *humanize(unit, amount))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Варианты аватара'),
+        ),
+    ]
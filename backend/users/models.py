@@ -19,11 +19,18 @@ class User(AbstractUser):
 
     avatar = models.ImageField(
         blank=True, null=True, upload_to='users/avatar/')
+    # Имя аватара, для которого готовы уменьшенная копия и WebP.
+    avatar_variants = models.CharField(
+        'Варианты аватара', max_length=100, blank=True, editable=False)
     username = models.CharField(
         'Логин', max_length=NAME_LENGTH, unique=True, blank=False)
     first_name = models.CharField('Имя', max_length=NAME_LENGTH, blank=False)
     last_name = models.CharField(
         'Фамилия', max_length=NAME_LENGTH, blank=False)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    subscribers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -1,8 +1,100 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from users.constants import PAGE_SIZE
 
+APPROXIMATE_COUNT = 'approximate'
+
+
+def approximate_count(queryset):
+    """Оценка количества строк по статистике PostgreSQL.
+
+    Для выборки без условий берется pg_class.reltuples, для выборки с
+    фильтрами - оценка планировщика из EXPLAIN. На других СУБД, а также
+    если статистика еще не собрана, выполняется точный COUNT(*).
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    if not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # Таблица без ANALYZE: -1 в PostgreSQL 14+, но 0 в 13 и раньше.
+        # Для пустой таблицы точный COUNT(*) тоже дешев.
+        if row and row[0] > 0:
+            return int(row[0])
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ApproximateCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    max_page_size = PAGE_SIZE
+    ordering = '-id'
+    count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('count') == APPROXIMATE_COUNT:
+            self.count = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+        return response
+
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная навигация по номеру страницы или по курсору.
+
+    Режим курсора включается параметром ?pagination=cursor или наличием
+    ?cursor=: он не считает COUNT(*) и не использует OFFSET. Параметр
+    ?count=approximate заменяет точный подсчет оценкой по статистике.
+    Курсор всегда идет по -id, поэтому ?ordering в этом режиме
+    не учитывается.
+    """
     page_size_query_param = 'limit'
     max_page_size = PAGE_SIZE
+    cursor_pagination = None
+
+    def is_cursor_mode(self, request):
+        return (request.query_params.get('pagination') == 'cursor'
+                or CustomCursorPagination.cursor_query_param
+                in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self.cursor_pagination = CustomCursorPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view)
+        if request.query_params.get('count') == APPROXIMATE_COUNT:
+            self.django_paginator_class = ApproximateCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response_schema(
+                schema)
+        return super().get_paginated_response_schema(schema)
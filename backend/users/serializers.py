@@ -2,13 +2,14 @@ import re
 
 from rest_framework import serializers
 
-from api.fields import Base64ImageField
+from api.fields import Base64ImageField, ImageVariantField
 from users.models import User
 
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализация пользователя."""
     is_subscribed = serializers.SerializerMethodField(default=False)
+    avatar = ImageVariantField()
 
     class Meta:
         model = User
@@ -24,6 +25,8 @@ class UserSerializer(serializers.ModelSerializer):
         return username
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.subscribing.filter(user=request.user).exists()
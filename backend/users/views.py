@@ -1,10 +1,15 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from api.serializers import SubscribeSerializer
+from api.bulk import bulk_add, bulk_remove
+from api.serializers import (BulkIdsSerializer, SubscribeSerializer,
+                             SubscribingSerializer)
+from recipes.counters import decrement
 from users.models import Subscription, User
 from users.paginators import CustomPagination
 from users.serializers import UserAvatarSerializer, UserSerializer
@@ -16,6 +21,16 @@ class UserViewSet(UserViewSet):
     permission_classes = []
     pagination_class = CustomPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action in ('list', 'retrieve') and user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, subscribing=OuterRef('pk'))
+            ))
+        return queryset
+
     @action(
         detail=False, methods=['get'],
         url_path='me',
@@ -51,26 +66,59 @@ class UserViewSet(UserViewSet):
         subscribing = get_object_or_404(User, pk=self.kwargs.get('id'))
         subscription = Subscription.objects.filter(
             user=request.user, subscribing=subscribing)
-        if subscription:
-            subscription.delete()
+        with transaction.atomic():
+            deleted, _ = subscription.delete()
+            if deleted:
+                decrement(User, subscribing.pk, 'subscribers_count')
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'Вы не подписаны на этого пользователя.'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(
+        detail=False, methods=['post'],
+        url_path='subscribe',
+        url_name='subscribe-bulk',
+        permission_classes=[permissions.IsAuthenticated]
+    )
+    def subscribe_bulk_post(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_add(
+            request.user, serializer.validated_data['ids'], Subscription,
+            'subscribing_id', User, 'subscribers_count',
+            excluded={request.user.pk},
+        )
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @subscribe_bulk_post.mapping.delete
+    def subscribe_bulk_delete(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = bulk_remove(
+            request.user, serializer.validated_data['ids'], Subscription,
+            'subscribing_id', User, 'subscribers_count',
+        )
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
     @action(
         detail=False, methods=['get'],
         url_path='subscriptions',
         permission_classes=[permissions.IsAuthenticated]
     )
     def subscriptions(self, request):
-        user_subscriptions = Subscription.objects.filter(
-            user=self.request.user)
-        paginator = self.paginate_queryset(user_subscriptions)
-        serializer = SubscribeSerializer(paginator,
-                                         context={'request': request},
-                                         many=True)
+        authors = (
+            User.objects
+            .filter(subscribing__user=request.user)
+            .annotate(is_subscribed=Value(True))
+            .order_by('-subscribing__id')
+        )
+        page = self.paginate_queryset(authors)
+        serializer = SubscribingSerializer(page,
+                                           context={'request': request},
+                                           many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(